@@ -0,0 +1,40 @@
+# Check the local email extractor against the labeled corpus in
+# email_corpus.jsonl (precision, recall, papers needing the LLM fallback) and
+# time it on paper-sized text: each sample followed by ~100k tokens of body.
+# Usage: python bench_emails.py [iterations]
+
+import json
+import sys
+import timeit
+from emails import find_emails
+
+CORPUS = "email_corpus.jsonl"
+BODY = "We measured expression at day 3 in all samples (Fig. 2a; n = 12). " * 6000
+
+
+def main(iterations=20):
+    with open(CORPUS, encoding="utf-8") as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+
+    true_positives = false_positives = false_negatives = fallbacks = 0
+    for sample in samples:
+        found, leftovers = find_emails(sample["text"])
+        expected = set(sample["emails"])
+        true_positives += len(expected & set(found))
+        false_positives += len(set(found) - expected)
+        false_negatives += len(expected - set(found))
+        fallbacks += bool(leftovers)
+        if set(found) != expected:
+            print(f"  {sample['id']}: found {found}, expected {sorted(expected)}, leftovers {leftovers}")
+    print(f"{CORPUS}: {len(samples)} papers, {sum(len(s['emails']) for s in samples)} emails")
+    print(f"  precision {true_positives / max(1, true_positives + false_positives):.3f}")
+    print(f"  recall    {true_positives / max(1, true_positives + false_negatives):.3f}")
+    print(f"  papers sent to the LLM fallback: {fallbacks}")
+
+    papers = [sample["text"] + "\n" + BODY for sample in samples]
+    seconds = min(timeit.repeat(lambda: [find_emails(paper) for paper in papers], number=iterations, repeat=3))
+    print(f"  {len(papers[0]) / 1024:.0f} KiB/paper: {seconds / iterations / len(papers) * 1000:.2f} ms/paper")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,35 @@
+# Benchmark the compiled lxml extractor against the previous BeautifulSoup
+# (html.parser) + nth-child CSS selector approach on a saved paper detail page
+# and a search listing (test_extract.py checks the fields read from them).
+# Usage: python bench_extract.py [iterations]
+
+import sys
+import timeit
+from bs4 import BeautifulSoup
+from extract import extract_page
+
+FIXTURES = ("biorxiv_detail.html", "biorxiv_listing.html")
+
+
+def parse_with_soup(content):
+    soup = BeautifulSoup(content, "html.parser")
+    soup.select_one("#block-system-main > div > div > div > div > div:nth-child(2) > div > div > div:nth-child(3) > div")
+    soup.select_one("#count_twitter")
+    soup.select_one("#p-3")
+    soup.select_one("#page-title")
+    soup.select("#block-system-main > div > div > div > div > div:nth-child(2) > div > div > div:nth-child(11) > div > div > div > ul > li > span > a")
+    soup.find_all("span", class_="highwire-cite-metadata-doi")
+
+
+def main(iterations=200):
+    for fixture in FIXTURES:
+        with open(fixture, encoding="utf-8") as f:
+            content = f.read()
+        print(f"{fixture}: {len(content) / 1024:.0f} KiB, {iterations} iterations")
+        for name, parse in (("bs4 html.parser", parse_with_soup), ("lxml compiled", extract_page)):
+            seconds = min(timeit.repeat(lambda: parse(content), number=iterations, repeat=3))
+            print(f"{name:>16}: {seconds / iterations * 1000:.2f} ms/page")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -3,17 +3,94 @@
 from datetime import datetime, timedelta
 import pytz
 import requests
-from bs4 import BeautifulSoup
+import aiohttp
 import asyncio
+from contextlib import asynccontextmanager
 from playwright.async_api import (
     async_playwright,
     TimeoutError as PlaywrightTimeoutError,
 )
 import nest_asyncio
+from scheduler import AdaptiveLimiter, TokenBucket, run_work_queue
+from biorxiv_api import ApiBackend
+from extract import extract_page_async, normalize_doi
+from ranking import TopKRanker, tweet_score
 
 # Apply the nest_asyncio patch
 nest_asyncio.apply()
 
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+
+# One Chromium browser and context shared by every scrape stage. Pages are
+# handed back to an idle pool after use so later fetches skip new-page setup,
+# and the context keeps its HTTP cache and connections for the whole run.
+class BrowserSession:
+    def __init__(self, headless=True, max_idle_pages=50):
+        self.headless = headless
+        self.max_idle_pages = max_idle_pages
+        self.browser = None
+        self.context = None
+        self._playwright = None
+        self._idle_pages = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        self._playwright = await async_playwright().start()
+        self.browser = await self._playwright.chromium.launch(headless=self.headless)
+        self.context = await self.browser.new_context(user_agent=USER_AGENT)
+
+    async def close(self):
+        self._idle_pages = []
+        if self.browser is not None:
+            await self.browser.close()
+            self.browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def acquire_page(self):
+        while self._idle_pages:
+            page = self._idle_pages.pop()
+            if not page.is_closed():
+                return page
+        return await self.context.new_page()
+
+    async def release_page(self, page):
+        if page.is_closed():
+            return
+        if len(self._idle_pages) < self.max_idle_pages:
+            self._idle_pages.append(page)
+        else:
+            await page.close()
+
+    # Borrow a warm page; pages that raised are closed instead of reused
+    @asynccontextmanager
+    async def page(self):
+        page = await self.acquire_page()
+        try:
+            yield page
+        except BaseException:
+            await page.close()
+            raise
+        await self.release_page(page)
+
+
+# Use the given session, or start a private one when called standalone
+@asynccontextmanager
+async def session_scope(session=None):
+    if session is not None:
+        yield session
+    else:
+        async with BrowserSession() as session:
+            yield session
+
 # Function to get date from yesterday ET time
 def get_yesterday_date():
     eastern = pytz.timezone("US/Eastern")
@@ -32,138 +109,267 @@ def construct_url():
     return complete_url
 
 # Function to extract pagination URLs
-async def extract_pagination_urls(complete_url):
+async def extract_pagination_urls(complete_url, session=None):
     pagination_urls = []
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-        page = await context.new_page()
-        
-        try:
-            await page.goto(complete_url)
-            await page.wait_for_load_state('networkidle', timeout=20000)
-            content = await page.content()
-            soup = BeautifulSoup(content, 'html.parser')
-            pagination_div = soup.find('div', class_='highwire-list page-group-items item-list')
-            if pagination_div:
-                pagination_links = pagination_div.find('ul', class_='pager pager-items')
-                pagination_urls.append(complete_url)
-                for link in pagination_links.find_all('a'):
-                    href = link.get('href')
-                    if href and not href.startswith('http'):
-                        href = f"https://www.biorxiv.org{href}"
-                    pagination_urls.append(href)
-        except PlaywrightTimeoutError:
-            print("Navigation timed out. Taking a screenshot...")
-            await page.screenshot(path='timeout_screenshot.png')  # Save screenshot on timeout
-            return []
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            await page.screenshot(path='error_screenshot.png')  # Save screenshot on other errors
-            return []
-        finally:
-            await browser.close()
-    return pagination_urls
-
-# Function to open pagination URLs and extract DOI links
-async def open_pagination_urls(pagination_urls):
-    all_doi_urls = []
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-        page = await context.new_page()
-
-        for url in pagination_urls:
+    async with session_scope(session) as session:
+        async with session.page() as page:
             try:
-                await page.goto(url)
+                await page.goto(complete_url)
                 await page.wait_for_load_state('networkidle', timeout=20000)
                 content = await page.content()
-                soup = BeautifulSoup(content, 'html.parser')
-                doi_elements = soup.find_all('span', class_='highwire-cite-metadata-doi')
-                for doi_element in doi_elements:
-                    doi_link = doi_element.get_text(strip=True).replace("doi:", "").strip()
-                    if doi_link:
-                        all_doi_urls.append(doi_link)
+                record = await extract_page_async(content)
+                pagination_urls.append(complete_url)
+                for href in record.pagination_urls:
+                    if href not in pagination_urls:
+                        pagination_urls.append(href)
             except PlaywrightTimeoutError:
-                print(f"Navigation to {url} timed out.")
+                print("Navigation timed out. Taking a screenshot...")
+                await page.screenshot(path='timeout_screenshot.png')  # Save screenshot on timeout
+                await page.close()
+                return []
             except Exception as e:
-                print(f"An error occurred while navigating to {url}: {e}")
+                print(f"An error occurred: {e}")
+                await page.screenshot(path='error_screenshot.png')  # Save screenshot on other errors
+                await page.close()
+                return []
+    return pagination_urls
 
-        await browser.close()
+# Function to open pagination URLs and extract DOI links. DOIs are normalized
+# and deduplicated across versions; when posted_date is given, results whose
+# listing shows a different posted date are dropped before any detail fetch.
+async def open_pagination_urls(pagination_urls, session=None, posted_date=None):
+    all_doi_urls = []
+    seen_dois = set()
+    async with session_scope(session) as session:
+        async with session.page() as page:
+            for url in pagination_urls:
+                try:
+                    await page.goto(url)
+                    await page.wait_for_load_state('networkidle', timeout=20000)
+                    content = await page.content()
+                    record = await extract_page_async(content)
+                    for doi in record.dois:
+                        if doi in seen_dois:
+                            continue
+                        seen_dois.add(doi)
+                        listing_date = record.posted_dates.get(doi)
+                        if posted_date and listing_date and listing_date != posted_date:
+                            continue
+                        all_doi_urls.append(f"https://doi.org/{doi}")
+                except PlaywrightTimeoutError:
+                    print(f"Navigation to {url} timed out.")
+                except Exception as e:
+                    print(f"An error occurred while navigating to {url}: {e}")
+    print(f"Found {len(all_doi_urls)} unique DOIs")
     return all_doi_urls
 
+# Keep only the latest version of each DOI from the ingestion backend
+def latest_versions(papers):
+    latest = {}
+    for paper in papers:
+        doi = normalize_doi(paper["doi"]) or paper["doi"]
+        current = latest.get(doi)
+        if current is None or int(paper["version"]) > int(current["version"]):
+            latest[doi] = paper
+    return list(latest.values())
+
 # Function to get top ten tweets
 def get_top_ten_tweets(tweet_data_list):
-    sorted_tweets = sorted(tweet_data_list, key=lambda x: int(x["tweet_count"]), reverse=True)
-    return sorted_tweets[:10]
+    ranker = TopKRanker(10, score=tweet_score)
+    for tweet_data in tweet_data_list:
+        ranker.push(tweet_data)
+    return ranker.results()
 
-# Function to fetch and parse tweet data
-async def fetch_and_parse(url, context, yesterday_date, tweet_data_list):
-    print(f"Fetching URL: {url}")
-    page = await context.new_page()
+# Parse the fields we need from a paper page. tweet_count is None when the
+# metrics widget has not been rendered (static HTML); returns None when the
+# page has no posted date (e.g. a bot-challenge page).
+async def parse_paper_page(content, url):
+    record = await extract_page_async(content)
+    if not record.date:
+        print(f"No posted date found on {url}")
+        return None
+    tweet_count = record.metrics.get("twitter")
+    return {
+        "date": record.date,
+        "tweet_count": str(tweet_count) if tweet_count is not None else None,
+        "abstract": record.abstract,
+        "title": record.title,
+        "subject_area": ", ".join(record.subject_areas) if record.subject_areas else "N/A",
+    }
+
+# Async HTTP client with pooled keep-alive connections for static page fetches
+def create_http_session(limit=50):
+    connector = aiohttp.TCPConnector(limit=limit, keepalive_timeout=30)
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers={"User-Agent": USER_AGENT},
+        timeout=aiohttp.ClientTimeout(total=30),
+    )
+
+# Plain GET of a paper page. Returns (ok, content): ok is False on 429, and
+# content is None whenever the static page is not usable.
+async def fetch_static_page(url, http):
+    try:
+        async with http.get(url) as response:
+            if response.status == 429:
+                print(f"Got status 429 for {url}. Skipping this paper.")
+                return False, None
+            if response.status != 200:
+                return True, None
+            return True, await response.text()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Static fetch of {url} failed: {e}")
+        return True, None
+
+# Render a paper page in the shared browser once the metrics widget is in.
+# Returns (ok, content): ok is False when biorxiv.org pushed back (timeout,
+# 403 or 429) so the scheduler can lower its concurrency.
+async def render_paper_page(url, session):
+    print(f"Rendering URL: {url}")
     try:
-        await page.goto(url, timeout=60000)
-        await page.wait_for_selector("#count_twitter", timeout=60000)
-        content = await page.content()
+        async with session.page() as page:
+            response = await page.goto(url, timeout=60000)
+            if response is not None and response.status in (403, 429):
+                print(f"Got status {response.status} for {url}. Skipping this paper.")
+                return False, None
+            await page.wait_for_selector("#count_twitter", timeout=60000)
+            return True, await page.content()
     except PlaywrightTimeoutError:
         print(f"Timeout error while fetching {url}. Skipping this paper.")
-        return  # Skip this paper
+        return False, None
     except Exception as e:
         print(f"An error occurred while navigating to {url}: {e}")
-        return  # Skip this paper
-    finally:
-        await page.close()
-
-    soup = BeautifulSoup(content, "html.parser")
-    date_element = soup.select_one("#block-system-main > div > div > div > div > div:nth-child(2) > div > div > div:nth-child(3) > div")
-    if date_element:
-        date_text = date_element.get_text(strip=True).replace("Posted\xa0", "").rstrip('.')
+        return True, None
+
+# Function to fetch and parse tweet data. The static page is fetched over HTTP
+# first; the browser only runs for papers posted on yesterday_date (to read the
+# metrics widget) or when the static page is blocked or unparseable.
+# throttle() is awaited before each request (see rank_work_queue).
+async def fetch_and_parse(url, session, yesterday_date, ranker, http=None, throttle=None):
+    print(f"Fetching URL: {url}")
+    paper = None
+    if http is not None:
+        if throttle is not None:
+            await throttle()
+        ok, content = await fetch_static_page(url, http)
+        if not ok:
+            return False
+        paper = await parse_paper_page(content, url) if content else None
+        if paper and paper["date"] != yesterday_date:
+            return True  # Skip this paper without rendering it
+
+    if paper is None or paper["tweet_count"] is None:
+        if throttle is not None:
+            await throttle()
+        ok, content = await render_paper_page(url, session)
+        if content is None:
+            return ok  # Skip this paper
+        paper = await parse_paper_page(content, url)
+        if paper is None or paper["date"] != yesterday_date:
+            return True
+
+    tweet_data = {
+        "url": url,
+        "tweet_count": paper["tweet_count"] or "0",
+        "abstract": paper["abstract"],
+        "title": paper["title"],
+        "subject_area": paper["subject_area"],
+    }
+    ranker.push(tweet_data)
+    return True
+
+
+# Run `fetch(item, ranker, throttle)` over all items through one work queue:
+# up to `concurrency` fetches in flight, at most `rate` requests per second
+# (a fetch awaits throttle() before each request it makes, since some make
+# two), backing off on push-back. Each record goes straight into the top-k
+# ranker; on_certain(record) is called as soon as a record's top-k place is
+# settled.
+async def rank_work_queue(items, fetch, ranker, concurrency=50, rate=10, on_certain=None):
+    limiter = AdaptiveLimiter(max_concurrency=concurrency)
+    bucket = TokenBucket(rate)
+    remaining = [len(items)]
+
+    async def worker(item):
         try:
-            page_date = datetime.strptime(date_text, "%B %d, %Y").strftime("%Y-%m-%d")
-            if page_date == yesterday_date:
-                tweet_element = soup.select_one("#count_twitter")
-                tweet_count = tweet_element.get_text(strip=True) if tweet_element else "0"
-                abstract_element = soup.select_one("#p-3")
-                abstract = abstract_element.get_text(strip=True) if abstract_element else "N/A"
-                title_element = soup.select_one("#page-title")
-                title = title_element.get_text(strip=True) if title_element else "N/A"
-                subject_area_elements = soup.select("#block-system-main > div > div > div > div > div:nth-child(2) > div > div > div:nth-child(11) > div > div > div > ul > li > span > a")
-                subject_area = ", ".join([element.get_text(strip=True) for element in subject_area_elements]) if subject_area_elements else "N/A"
-                tweet_data = {
-                    "url": url,
-                    "tweet_count": tweet_count,
-                    "abstract": abstract,
-                    "title": title,
-                    "subject_area": subject_area,
-                }
-                tweet_data_list.append(tweet_data)
-        except ValueError as e:
-            print(f"Error parsing date on {url}: {e}")
-
-
-async def main(all_doi_urls, yesterday_date, batch_size=50, delay=5):
-    tweet_data_list = []
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-
-        for i in range(0, len(all_doi_urls), batch_size):
-            batch = all_doi_urls[i : i + batch_size]
-            print(f"Processing batch: {batch}")
-            tasks = [fetch_and_parse(url, context, yesterday_date, tweet_data_list) for url in batch]
-            await asyncio.gather(*tasks)
-            await asyncio.sleep(delay)
-
-        await browser.close()
-    return get_top_ten_tweets(tweet_data_list)
-
-# Main function to run the entire process
-async def get_trending_urls():
-    complete_url = construct_url()
-    pagination_urls = await extract_pagination_urls(complete_url)
-    all_doi_urls = await open_pagination_urls(pagination_urls)
-    yesterday_date = get_yesterday_date()
-    return await main(all_doi_urls, yesterday_date)
+            return await fetch(item, ranker, bucket.acquire)
+        finally:
+            remaining[0] -= 1
+            if on_certain is not None:
+                for record in ranker.release_certain(remaining[0]):
+                    on_certain(record)
+
+    await run_work_queue(items, worker, limiter)
+    return ranker.results()
+
+
+async def main(all_doi_urls, yesterday_date, session=None, concurrency=50, rate=10, ranker=None, on_certain=None):
+    ranker = ranker or TopKRanker(10)
+    async with session_scope(session) as session, create_http_session(concurrency) as http:
+        print(f"Processing {len(all_doi_urls)} papers")
+
+        async def fetch(url, ranker, throttle):
+            return await fetch_and_parse(url, session, yesterday_date, ranker, http, throttle)
+
+        return await rank_work_queue(all_doi_urls, fetch, ranker, concurrency, rate, on_certain)
+
+# Add download counts and the tweet count to a paper from the ingestion backend.
+# Metadata already comes from the backend, so the browser is only needed for
+# the metrics widget. That is two requests, each awaiting throttle() first.
+async def fetch_paper_metrics(paper, backend, session, ranker, throttle=None):
+    if throttle is not None:
+        await throttle()
+    usage = await backend.usage(paper)
+    if throttle is not None:
+        await throttle()
+    ok, content = await render_paper_page(paper["url"], session)
+    if content is None and not ok:
+        return False
+    page = await parse_paper_page(content, paper["url"]) if content else None
+    tweet_data = {
+        "url": paper["url"],
+        "doi": paper["doi"],
+        "version": paper["version"],
+        "date": paper["date"],
+        "tweet_count": (page and page["tweet_count"]) or "0",
+        "abstract": paper["abstract"],
+        "title": paper["title"],
+        "subject_area": paper["category"],
+        "abstract_views": usage.get("abstract_views", 0),
+        "pdf_downloads": usage.get("pdf_downloads", 0),
+    }
+    ranker.push(tweet_data)
+    return True
+
+
+# Ingest one day of papers from the bioRxiv API and collect their metrics
+async def main_api(yesterday_date, session=None, backend=None, concurrency=50, rate=10, ranker=None, on_certain=None):
+    ranker = ranker or TopKRanker(10)
+    async with session_scope(session) as session, create_http_session(concurrency) as http:
+        backend = backend or ApiBackend(http)
+        papers = latest_versions([paper async for paper in backend.papers(yesterday_date) if paper["date"] == yesterday_date])
+        print(f"Processing {len(papers)} papers")
+
+        async def fetch(paper, ranker, throttle):
+            return await fetch_paper_metrics(paper, backend, session, ranker, throttle)
+
+        return await rank_work_queue(papers, fetch, ranker, concurrency, rate, on_certain)
+
+# Main function to run the entire process, sharing one browser across all stages.
+# source="api" ingests from api.biorxiv.org; source="search" scrapes the
+# HTML search results instead. Returns the top_k papers (top ten for posting;
+# batch mode asks for a wider candidate set). on_certain(record) is called for
+# each paper as soon as its top-k place is settled.
+async def get_trending_urls(source="api", on_certain=None, yesterday_date=None, top_k=10):
+    yesterday_date = yesterday_date or get_yesterday_date()
+    ranker = TopKRanker(top_k)
+    async with BrowserSession() as session:
+        if source == "api":
+            return await main_api(yesterday_date, session, ranker=ranker, on_certain=on_certain)
+        complete_url = construct_url()
+        pagination_urls = await extract_pagination_urls(complete_url, session)
+        all_doi_urls = await open_pagination_urls(pagination_urls, session, yesterday_date)
+        return await main(all_doi_urls, yesterday_date, session, ranker=ranker, on_certain=on_certain)
 
 # Entry point for the script
 if __name__ == "__main__":
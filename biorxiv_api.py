@@ -0,0 +1,79 @@
+import asyncio
+import aiohttp
+from extract import USAGE_METRICS, extract_page_async
+
+BIORXIV_API_URL = "https://api.biorxiv.org"
+BIORXIV_SITE_URL = "https://www.biorxiv.org"
+
+
+# Interface for paper ingestion. papers(date) is an async generator yielding
+# one dict per posted paper version (doi, version, date, category, title,
+# abstract, url); usage(paper) returns its download counters.
+class IngestionBackend:
+    async def papers(self, date):
+        raise NotImplementedError
+        yield
+
+    async def usage(self, paper):
+        return {}
+
+
+# Backend on the paginated JSON details endpoint:
+#   {api_url}/details/{server}/{date}/{date}/{cursor}
+# Per-paper usage is not exposed by the API (its /usage endpoint is
+# site-wide), so download counts come from the static .article-metrics page.
+# Both base URLs can point at a local stand-in server.
+class ApiBackend(IngestionBackend):
+    def __init__(self, http, api_url=BIORXIV_API_URL, site_url=BIORXIV_SITE_URL, server="biorxiv"):
+        self.http = http
+        self.api_url = api_url.rstrip("/")
+        self.site_url = site_url.rstrip("/")
+        self.server = server
+
+    async def _get_json(self, url, retries=3):
+        for attempt in range(retries):
+            try:
+                async with self.http.get(url) as response:
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Request to {url} failed: {e}")
+                if attempt == retries - 1:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+
+    async def papers(self, date):
+        cursor = 0
+        while True:
+            url = f"{self.api_url}/details/{self.server}/{date}/{date}/{cursor}"
+            data = await self._get_json(url)
+            collection = data.get("collection") or []
+            for item in collection:
+                yield {
+                    "doi": item["doi"],
+                    "version": str(item.get("version", "1")),
+                    "date": item.get("date"),
+                    "category": (item.get("category") or "N/A").strip().title(),
+                    "title": item.get("title", "N/A"),
+                    "abstract": item.get("abstract", "N/A"),
+                    "url": f"{self.site_url}/content/{item['doi']}v{item.get('version', '1')}",
+                }
+            messages = data.get("messages") or [{}]
+            total = int(messages[0].get("total", 0) or 0)
+            cursor += len(collection)
+            if not collection or cursor >= total:
+                return
+
+    async def usage(self, paper):
+        url = f"{paper['url']}.article-metrics"
+        try:
+            async with self.http.get(url) as response:
+                if response.status != 200:
+                    return {}
+                content = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Could not fetch usage for {paper['doi']}: {e}")
+            return {}
+        record = await extract_page_async(content)
+        return {name: record.metrics[name] for name in USAGE_METRICS if name in record.metrics}
+
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.getenv("PAPER_CACHE_DIR", ".cache")
+
+
+def content_hash(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+# Persistent cache for scraped metadata, extracted PDF text and LLM summaries.
+# Values live in a content-addressed blob directory (blobs/ab/abcdef...) and an
+# SQLite index maps keys to blobs. Entries older than max_age_days are dropped,
+# and the least recently used ones go when the blobs exceed max_bytes.
+#
+# Keys used by the bots:
+#   paper:<paper>           scraped paper record (JSON)
+#   arxiv:<id>              title and publish date from the arXiv API (JSON)
+#   text:<paper>:<limit>    extracted PDF text for a token limit
+#   summary:<prompt>:<sha>  summary for a prompt version and text hash
+#   github:<kind>:<query>   GitHub user search / profile response with ETag
+# where <paper> is DOI+version for bioRxiv and the arXiv id for arXiv.
+class PaperCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=512 * 1024 * 1024, max_age_days=30):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, "blobs")
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, blob TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_blob ON entries (blob)")
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite"), timeout=30)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def get(self, key):
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT blob, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            digest, created = row
+            if time.time() - created > self.max_age:
+                self._delete(db, key, digest)
+                return None
+            try:
+                with open(self._blob_path(digest), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+        return data
+
+    def put(self, key, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        digest = content_hash(data)
+        path = self._blob_path(digest)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            now = time.time()
+            with self._connect() as db:
+                old = db.execute("SELECT blob FROM entries WHERE key = ?", (key,)).fetchone()
+                db.execute(
+                    "INSERT OR REPLACE INTO entries (key, blob, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, digest, len(data), now, now),
+                )
+                if old and old[0] != digest:
+                    self._drop_blob_if_unused(db, old[0])
+        self.evict()
+        return digest
+
+    def get_text(self, key):
+        data = self.get(key)
+        return data.decode("utf-8") if data is not None else None
+
+    def get_json(self, key):
+        data = self.get(key)
+        return json.loads(data) if data is not None else None
+
+    def put_json(self, key, value):
+        return self.put(key, json.dumps(value, default=str, sort_keys=True))
+
+    def _delete(self, db, key, digest):
+        db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self._drop_blob_if_unused(db, digest)
+
+    def _drop_blob_if_unused(self, db, digest):
+        if db.execute("SELECT 1 FROM entries WHERE blob = ? LIMIT 1", (digest,)).fetchone() is None:
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        with self._lock, self._connect() as db:
+            expired = db.execute(
+                "SELECT key, blob FROM entries WHERE created < ?", (time.time() - self.max_age,)
+            ).fetchall()
+            for key, digest in expired:
+                self._delete(db, key, digest)
+            # Blobs shared by several keys are only counted once
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT blob, size FROM entries)").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, digest, size in db.execute("SELECT key, blob, size FROM entries ORDER BY accessed").fetchall():
+                self._delete(db, key, digest)
+                if db.execute("SELECT 1 FROM entries WHERE blob = ? LIMIT 1", (digest,)).fetchone() is None:
+                    total -= size
+                if total <= self.max_bytes:
+                    return
+
+
+_default_cache = None
+
+
+# Process-wide cache shared by ai.py and create_image.py
+def get_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PaperCache()
+    return _default_cache
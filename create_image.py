@@ -1,89 +1,124 @@
-import requests
-import fitz  # PyMuPDF
+import re
 import arxiv
-import tiktoken
-from openai import OpenAI
-import os
-import json
 from dotenv import load_dotenv
-from PIL import Image, ImageDraw, ImageFont
-import textwrap
-from datetime import datetime
 from github import process_paper
+from cache import get_cache
+from summarizer import summarize_text as summarize_source_text
+from sections import DEFAULT_CONTEXT_BUDGET
+from render import card_path
+from sources import ARXIV, arxiv_paper, paper_text, save_card
 
 # Load environment variables from .env file
 load_dotenv()
 
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Ids per arXiv API query. id_list goes into the query URL, so batches stay
+# well below the API's page limit.
+ARXIV_BATCH_SIZE = 100
+
+# New-style (2106.14881, 2106.14881v2) and old-style (hep-th/9901001,
+# math.GT/0309136) arXiv ids. The API rejects a whole query over one
+# malformed id, so those never reach it.
+_ARXIV_ID = re.compile(r"(?:\d{4}\.\d{4,5}|[a-z]+(?:-[a-z]+)*(?:\.[A-Z]{2})?/\d{7})(?:v\d+)?")
+
+_arxiv_client = None
+
+
+# One client for the process: it spaces its requests delay_seconds apart, as
+# the arXiv API terms ask (about 3s), across all lookups
+def get_arxiv_client():
+    global _arxiv_client
+    if _arxiv_client is None:
+        _arxiv_client = arxiv.Client(page_size=ARXIV_BATCH_SIZE, delay_seconds=3.0, num_retries=3)
+    return _arxiv_client
+
+
+# Title and publish date for many arXiv ids: {arxiv_id: {"title", "publish_date"}}.
+# Cached ids cost nothing; the rest are fetched batch_size ids per query.
+# Malformed ids and ids arXiv does not know are left out. A batch the API
+# rejects is retried one id at a time, so one bad id only loses itself.
+def resolve_arxiv_metadata(arxiv_ids, batch_size=ARXIV_BATCH_SIZE, client=None):
+    cache = get_cache()
+    resolved = {}
+    missing = []
+    for arxiv_id in dict.fromkeys(arxiv_ids):
+        if not _ARXIV_ID.fullmatch(arxiv_id):
+            print(f"Skipping malformed arXiv id {arxiv_id!r}")
+            continue
+        metadata = cache.get_json(f"arxiv:{arxiv_id}")
+        if metadata is None:
+            missing.append(arxiv_id)
+        else:
+            resolved[arxiv_id] = metadata
+
+    client = client or get_arxiv_client()
+
+    def lookup(batch):
+        # Results come back as versioned ids (2106.14881v2); match them to the
+        # ids as requested, with or without a version
+        requested = set(batch)
+        search = arxiv.Search(id_list=batch, max_results=len(batch))
+        for paper in client.results(search):
+            short_id = paper.get_short_id()
+            arxiv_id = short_id if short_id in requested else re.sub(r"v\d+$", "", short_id)
+            if arxiv_id not in requested:
+                continue
+            metadata = {"title": paper.title, "publish_date": str(paper.published.date())}
+            cache.put_json(f"arxiv:{arxiv_id}", metadata)
+            resolved[arxiv_id] = metadata
+
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        try:
+            lookup(batch)
+        except arxiv.ArxivError as e:
+            if len(batch) == 1:
+                print(f"Could not look up arXiv paper {batch[0]}: {e}")
+                continue
+            print(f"arXiv lookup of {len(batch)} ids failed ({e}); retrying them one at a time")
+            for arxiv_id in batch:
+                if arxiv_id in resolved:
+                    continue
+                try:
+                    lookup([arxiv_id])
+                except arxiv.ArxivError as e:
+                    print(f"Could not look up arXiv paper {arxiv_id}: {e}")
+    return resolved
+
+
+# Title and publish date of a single arXiv paper
+def fetch_arxiv_metadata(arxiv_id):
+    metadata = resolve_arxiv_metadata([arxiv_id]).get(arxiv_id)
+    if metadata is None:
+        raise LookupError(f"arXiv paper {arxiv_id} not found")
+    return metadata
 
 
 def download_and_extract_paper_info(
     arxiv_id, token_limit=120000, model="gpt-3.5-turbo"
 ):
-    search = arxiv.Search(id_list=[arxiv_id])
-    paper = next(search.results())
-
-    title = paper.title
-    publish_date = paper.published.date()
-
-    pdf_url = f"https://arxiv.org/pdf/{arxiv_id}.pdf"
-    response = requests.get(pdf_url)
-    if response.status_code == 200:
-        pdf_content = response.content
-
-        doc = fitz.open(stream=pdf_content, filetype="pdf")
-        text = ""
-        encoding = tiktoken.encoding_for_model(model)
-
-        for page in doc:
-            page_text = page.get_text()
-            text += page_text
-
-            tokens = encoding.encode(text)
-            if len(tokens) > token_limit:
-                text = encoding.decode(tokens[:token_limit])
-                break
-        #twitter_handles = process_paper(text)
-        # this will either be an empty list or a list with twitter handles
-        return {
-            "title": title,
-            "publish_date": publish_date,
-            "full_text": text,
-            #"twitter_handles": twitter_handles,
-        }
-    else:
-        print(f"Failed to download paper. Status code: {response.status_code}")
+    # Metadata and text from an earlier run for the same arXiv id are reused
+    metadata = fetch_arxiv_metadata(arxiv_id)
+    text = paper_text(ARXIV, arxiv_paper(arxiv_id, metadata), token_limit, model)
+    if text is None:
         return None
 
+    #twitter_handles = process_paper(text)
+    # this will either be an empty list or a list with twitter handles
+    return {
+        "title": metadata["title"],
+        "publish_date": metadata["publish_date"],
+        "full_text": text,
+        #"twitter_handles": twitter_handles,
+    }
 
-def summarize_text(text):
-    prompt = f""" 
-    You are getting the text version of an arxiv paper your goal is to provide a summary of the paper by providing bullet points which summarise the paper. 
-
-    It should be exact three bullet points which summarise the paper. Return your response in JSON format where the keys are the bullet points and the values are the summaries of the bullet points as following:
-
-    {{
-    "bullet_point_1": "content",
-    "bullet_point_2": "content",
-    "bullet_point_3": "content"
-    }}
-
-    Here is the text of the paper:
-
-    {text}
-    """
-
-    completion = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        response_format={"type": "json_object"},
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.0,
-    )
 
-    summary = completion.choices[0].message.content
-    return summary
+def summarize_text(text, context_budget=DEFAULT_CONTEXT_BUDGET):
+    return summarize_source_text(text, ARXIV.name, context_budget)
 
 
+# Thin wrapper over the shared CardRenderer, which keeps the scaled
+# background, fonts and watermark between calls
 def add_text_to_image(
     background_path,
     title,
@@ -93,111 +128,14 @@ def add_text_to_image(
     scale_factor=2,
     offset=20,
 ):
-    with Image.open(background_path) as img:
-        width, height = img.size
-        background = img.resize(
-            (width * scale_factor, height * scale_factor), Image.LANCZOS
-        )
-
-    draw = ImageDraw.Draw(background)
-
-    title_font = ImageFont.truetype("fonts/Inika-Regular.ttf", 35 * scale_factor)
-    content_font = ImageFont.truetype("fonts/Inika-Regular.ttf", 25 * scale_factor)
-    date_font = ImageFont.truetype("fonts/Inika-Regular.ttf", 20 * scale_factor)
-    arxiv_font = ImageFont.truetype("fonts/Larabieb.ttf", 50 * scale_factor)
-
-    margin = 50 * scale_factor
-    max_width = background.width - (2 * margin)
-
-    # Dynamically calculate the width for wrapping the title
-    wrapped_title = textwrap.wrap(
-        title, width=int(max_width / (35 * scale_factor * 0.6))
-    )
-    y_text = 50 * scale_factor
-
-    for line in wrapped_title:
-        bbox = title_font.getbbox(line)
-        line_width = bbox[2] - bbox[0]
-        line_height = bbox[3] - bbox[1]
-        x_text = (background.width - line_width) // 2
-        draw.text((x_text, y_text), line, font=title_font, fill=(0, 0, 0))
-        y_text += line_height + (10 * scale_factor)
-
-    bullet_points = json.loads(text_content)
-    total_height = sum(
-        len(textwrap.wrap(value, width=90)) * (25 * scale_factor) + (20 * scale_factor)
-        for value in bullet_points.values()
-    )
-    y = (background.height - total_height) // 2
-    bullet_width = content_font.getbbox("• ")[2]
-    max_content_width = max(
-        max(content_font.getbbox(line)[2] for line in textwrap.wrap(value, width=90))
-        for value in bullet_points.values()
-    )
-    bullet_start_x = (background.width - max_content_width - bullet_width) // 2
-
-    for value in bullet_points.values():
-        wrapped_text = textwrap.wrap(value, width=90)
-
-        for i, line in enumerate(wrapped_text):
-            if i == 0:
-                draw.text((bullet_start_x, y), "•", font=content_font, fill=(0, 0, 0))
-                draw.text(
-                    (bullet_start_x + bullet_width, y),
-                    line,
-                    font=content_font,
-                    fill=(0, 0, 0),
-                )
-            else:
-                draw.text(
-                    (bullet_start_x + bullet_width, y + (25 * scale_factor * i)),
-                    line,
-                    font=content_font,
-                    fill=(0, 0, 0),
-                )
-
-        y += (25 * scale_factor * len(wrapped_text)) + (20 * scale_factor)
-
-    date_text = f"Published: {publish_date}"
-    date_bbox = date_font.getbbox(date_text)
-    date_height = date_bbox[3] - date_bbox[1]
-    draw.text(
-        (margin, background.height - margin - date_height - offset),
-        date_text,
-        font=date_font,
-        fill=(0, 0, 0),
-    )
-
-    arxiv_text = "@arXivGPT"
-    arxiv_bbox = arxiv_font.getbbox(arxiv_text)
-    arxiv_width = arxiv_bbox[2] - arxiv_bbox[0]
-    arxiv_height = arxiv_bbox[3] - arxiv_bbox[1]
-    arxiv_x = background.width - margin - arxiv_width
-    arxiv_y = background.height - margin - arxiv_height - offset
-
-    pre_x_text = "@ar"
-    pre_x_width = arxiv_font.getbbox(pre_x_text)[2]
-    draw.text((arxiv_x, arxiv_y), pre_x_text, font=arxiv_font, fill=(0, 0, 0))
-
-    x_text = "X"
-    x_width = arxiv_font.getbbox(x_text)[2]
-    draw.text((arxiv_x + pre_x_width, arxiv_y), x_text, font=arxiv_font, fill="#B31B1B")
-
-    post_x_text = "ivGPT"
-    draw.text(
-        (arxiv_x + pre_x_width + x_width, arxiv_y),
-        post_x_text,
-        font=arxiv_font,
-        fill=(0, 0, 0),
-    )
-
-    background.save(output_path, quality=95)
-    print(f"High-resolution image saved as {output_path}")
+    save_card(ARXIV, title, text_content, f"Published: {publish_date}", output_path, background_path, scale_factor, offset)
 
 
 def create_image_from_url(
-    arxiv_id, background_path="background.jpg", output_path="output.jpg"
+    arxiv_id, background_path="background.jpg", output_path=None
 ):
+    # Each paper gets its own card file so cards never overwrite each other
+    output_path = output_path or card_path(arxiv_id)
     paper_info = download_and_extract_paper_info(arxiv_id)
     if paper_info:
         title = paper_info.get("title")
@@ -0,0 +1,139 @@
+import re
+
+# Author emails sit on the first page(s) or in a correspondence block, so
+# only the head of the text and the surroundings of correspondence keywords
+# are scanned
+FRONT_CHARS = 12000
+BLOCK_CHARS = 600
+LEFTOVER_CHARS = 160
+
+# A local part never ends in "." or has two in a row, so "et al." is no address
+_LOCAL = r"[A-Za-z0-9](?:[A-Za-z0-9_%+\-]|\.(?=[A-Za-z0-9_%+\-]))*"
+_LABEL = r"[A-Za-z0-9](?:[A-Za-z0-9\-]*[A-Za-z0-9])?"
+_TLD = r"[A-Za-z]{2,24}"
+_DOMAIN = rf"(?:{_LABEL}\.)+{_TLD}"
+
+_EMAIL = re.compile(rf"(?<![\w.%+\-]){_LOCAL}@{_DOMAIN}(?![\w\-]|\.\w)")
+# {anna,bob}@x.org, (anna; bob)@x.org, [anna|bob]@x.org
+_GROUP = re.compile(
+    rf"[{{(\[]\s*({_LOCAL}(?:\s*[,;|]\s*{_LOCAL})+)\s*[}})\]]\s*@\s*({_DOMAIN})(?![\w\-]|\.\w)"
+)
+# anna [at] x [dot] org, anna(at)x.org, anna <at> x.org
+_BRACKET_AT = r"\s*[\[({<]\s*at\s*[\])}>]\s*"
+_BRACKET_DOT = r"(?:\s*[\[({<]\s*dot\s*[\])}>]\s*|\.)"
+_BRACKETED = re.compile(
+    rf"(?<![\w.%+\-])({_LOCAL}){_BRACKET_AT}((?:{_LABEL}{_BRACKET_DOT})+{_TLD})\b", re.IGNORECASE
+)
+# anna at x dot org: the bare-word form needs at least one spelled-out "dot",
+# otherwise prose like "data at www.example.org" would match. Even so it reads
+# prose ("available at github dot com"), so it only counts next to a
+# correspondence/email label (see _label_windows).
+_WORDS = re.compile(
+    rf"(?<![\w.%+\-])({_LOCAL})\s+at\s+((?:{_LABEL}(?:\s+dot\s+|\.))*{_LABEL}\s+dot\s+{_TLD})\b", re.IGNORECASE
+)
+_DOT_WORD = re.compile(r"\s*[\[({<]?\s*dot\s*[\])}>]?\s*", re.IGNORECASE)
+# An address broken over a line at the "@" or after a dot
+_BROKEN = re.compile(r"(?<=[\w.])[ \t]*\n[ \t]*(?=@)|(?<=@)[ \t]*\n[ \t]*(?=\w)|(?<=\w\.)\n(?=[a-z])")
+_EMAIL_KEYWORD = re.compile(
+    r"\bcorrespond(?:ence|ing\s+authors?)\b|\be-?mails?\b(?:\s+address(?:es)?)?\s*[:(]", re.IGNORECASE
+)
+_KEYWORD_LITERALS = ("orrespond", "ORRESPOND", "mail", "Mail", "MAIL")
+# "@" that is part of a social handle or a bare decorator, not an address
+_HANDLE = re.compile(r"(?<![\w.])@\w+\b(?!\.\w)")
+
+
+# Spans of a chunk from a correspondence/email label to the end of the line
+# after it, where a spelled-out address would be written
+def _label_windows(chunk):
+    windows = []
+    for match in _EMAIL_KEYWORD.finditer(chunk):
+        end = chunk.find("\n", match.end())
+        end = chunk.find("\n", end + 1) if end != -1 else -1
+        windows.append((match.start(), len(chunk) if end == -1 else end))
+    return windows
+
+
+def _normalize(local, domain):
+    domain = _DOT_WORD.sub(".", domain) if not re.fullmatch(_DOMAIN, domain) else domain
+    return f"{local}@{domain}".strip(".").lower()
+
+
+# Head of the text plus windows around correspondence keywords, as
+# (start, end) spans of the original text with overlaps merged
+def _scan_spans(text):
+    spans = [(0, min(len(text), FRONT_CHARS))]
+    # Plain substring search finds the rare candidates in the body much
+    # faster than a case-insensitive regex pass; the regex then checks each
+    candidates = set()
+    for literal in _KEYWORD_LITERALS:
+        position = text.find(literal, FRONT_CHARS)
+        while position != -1:
+            candidates.add(position)
+            position = text.find(literal, position + 1)
+    for position in sorted(candidates):
+        match = _EMAIL_KEYWORD.search(text, max(FRONT_CHARS, position - 3), position + 40)
+        if match:
+            spans.append((max(0, match.start() - 80), min(len(text), match.end() + BLOCK_CHARS)))
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+# Deterministic author-email extraction. Returns (emails, leftovers): the
+# emails in order of appearance, lowercased and deduplicated, and short
+# snippets around an "@" or a correspondence line that could not be parsed,
+# for a fallback reader to look at.
+def find_emails(text):
+    emails = []
+    leftovers = []
+    for start, end in _scan_spans(text or ""):
+        chunk = _BROKEN.sub("", text[start:end])
+        covered = []
+        matched = []  # (position, addresses)
+        for pattern in (_GROUP, _BRACKETED, _WORDS, _EMAIL):
+            if pattern is _WORDS:
+                matches = [m for s, e in _label_windows(chunk) for m in pattern.finditer(chunk, s, e)]
+            else:
+                matches = pattern.finditer(chunk)
+            for match in matches:
+                if any(s <= match.start() < e for s, e in covered):
+                    continue
+                covered.append(match.span())
+                if pattern is _GROUP:
+                    locals_ = re.split(r"\s*[,;|]\s*", match.group(1))
+                    matched.append((match.start(), [_normalize(local, match.group(2)) for local in locals_]))
+                elif pattern is _EMAIL:
+                    matched.append((match.start(), [_normalize(*match.group(0).split("@"))]))
+                else:
+                    matched.append((match.start(), [_normalize(match.group(1), match.group(2))]))
+        for _, addresses in sorted(matched):
+            emails.extend(addresses)
+
+        # Leftovers: an "@" outside every match (social handles aside), or a
+        # correspondence/email label with no address right after it
+        found = list(covered)
+        covered.extend(match.span() for match in _HANDLE.finditer(chunk))
+        unclear = [m.start() for m in re.finditer("@", chunk) if not any(s <= m.start() < e for s, e in covered)]
+        unclear += [
+            m.start() for m in _EMAIL_KEYWORD.finditer(chunk)
+            if not any(m.start() <= s < m.end() + LEFTOVER_CHARS for s, _ in found)
+        ]
+        last = -1
+        for position in sorted(unclear):
+            if position < last:
+                continue
+            last = position + LEFTOVER_CHARS
+            leftovers.append(" ".join(chunk[max(0, position - LEFTOVER_CHARS // 2): last].split()))
+    return list(dict.fromkeys(emails)), leftovers
+
+
+# Whether an address handed back by a fallback reader is well-formed and its
+# local part really occurs in the text it was read from
+def plausible_email(address, source):
+    if not isinstance(address, str) or not re.fullmatch(rf"{_LOCAL}@{_DOMAIN}", address.strip()):
+        return False
+    return address.split("@")[0].lower() in source.lower()
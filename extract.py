@@ -0,0 +1,183 @@
+import asyncio
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import lxml.html
+from lxml import etree
+
+
+# Everything we read from a bioRxiv page. Detail pages fill title, abstract,
+# date, subject areas, their DOI and metric counts; search listings fill DOIs,
+# listing dates and pagination links; .article-metrics pages fill the usage
+# counts (USAGE_METRICS) in metrics.
+@dataclass
+class PageRecord:
+    title: str = "N/A"
+    abstract: str = "N/A"
+    date: Optional[str] = None
+    subject_areas: List[str] = field(default_factory=list)
+    dois: List[str] = field(default_factory=list)
+    posted_dates: Dict[str, str] = field(default_factory=dict)
+    metrics: Dict[str, int] = field(default_factory=dict)
+    pagination_urls: List[str] = field(default_factory=list)
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Selectors are compiled once at import. The detail-page paths mirror the old
+# nth-child CSS selectors (*[n][self::div] keeps nth-child semantics). id()
+# uses the parser's index of id attributes instead of scanning the document.
+_ARTICLE = "id('block-system-main')/div/div/div/div/*[2][self::div]/div/div"
+_DATE = etree.XPath(f"{_ARTICLE}/*[3][self::div]/div")
+_SUBJECT_AREAS = etree.XPath(f"{_ARTICLE}/*[11][self::div]/div/div/div/ul/li/span/a")
+_TITLE = etree.XPath("id('page-title')")
+_ABSTRACT = etree.XPath("id('p-3')")
+_META_DOI = etree.XPath("//meta[@name='citation_doi']/@content")
+_META_TITLE = etree.XPath("//meta[@name='citation_title']/@content")
+_METRICS = {
+    "twitter": etree.XPath("id('count_twitter')"),
+}
+_LISTING_DOIS = etree.XPath(f"//span[{_has_class('highwire-cite-metadata-doi')}]")
+_LISTING_ITEM = etree.XPath("ancestor::li[1]")
+_LISTING_DATE = etree.XPath(f".//*[{_has_class('highwire-cite-metadata-date')} or {_has_class('pub-date')}]")
+_TABLES = etree.XPath("//table[.//th]")
+_HEADERS = etree.XPath(".//th")
+_ROWS = etree.XPath(".//tr")
+_CELLS = etree.XPath("td")
+# Usage table column -> metrics key
+_USAGE_COLUMNS = {"abstract": "abstract_views", "full": "full_text_views", "pdf": "pdf_downloads"}
+USAGE_METRICS = tuple(_USAGE_COLUMNS.values())
+_PAGER_LINKS = etree.XPath(
+    f"//div[{_has_class('highwire-list')} and {_has_class('page-group-items')}]"
+    f"//ul[{_has_class('pager-items')}]//a/@href"
+)
+
+_DOI_PATTERN = re.compile(r"10\.\d{4,9}/[^\s?#]+")
+_DATE_PATTERN = re.compile(r"([A-Z][a-z]+\.? \d{1,2}, \d{4})")
+_DATE_FORMATS = ("%B %d, %Y", "%b %d, %Y", "%b. %d, %Y")
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+
+def _text(element):
+    return " ".join(element.text_content().split())
+
+
+def _first_text(xpath, tree):
+    elements = xpath(tree)
+    return _text(elements[0]) if elements else None
+
+
+# Reduce a DOI link or content URL to its bare DOI, without the resolver
+# prefix or a trailing version suffix (v1, v2, ...)
+def normalize_doi(doi_link):
+    match = _DOI_PATTERN.search(doi_link)
+    if not match:
+        return None
+    doi = match.group(0).rstrip(".")
+    doi = re.sub(r"\.(full|abstract|article-metrics)(\.pdf)?$", "", doi)
+    return re.sub(r"v\d+$", "", doi)
+
+
+# Parse "Posted September 19, 2024." style text into YYYY-MM-DD
+def parse_posted_date(text):
+    match = _DATE_PATTERN.search(text or "")
+    if not match:
+        return None
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(match.group(1), fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+# Sum the monthly Abstract / Full / PDF columns of an article-metrics usage
+# table; {} when the page has none
+def _usage_totals(tree):
+    for table in _TABLES(tree):
+        headers = [_text(th).lower() for th in _HEADERS(table)]
+        if "abstract" not in headers or "pdf" not in headers:
+            continue
+        columns = {name: headers.index(name) for name in _USAGE_COLUMNS if name in headers}
+        totals = dict.fromkeys(USAGE_METRICS, 0)
+        for row in _ROWS(table):
+            cells = [_text(td).replace(",", "") for td in _CELLS(row)]
+            if len(cells) != len(headers):
+                continue
+            for name, index in columns.items():
+                if cells[index].isdigit():
+                    totals[_USAGE_COLUMNS[name]] += int(cells[index])
+        return totals
+    return {}
+
+
+# Parse a page into an lxml tree, or None when there is nothing to parse (an
+# empty or comment-only body). lxml refuses a str that carries an
+# <?xml ... encoding=...?> declaration; the text is already decoded, so the
+# declaration is dropped.
+def _parse_tree(content):
+    try:
+        try:
+            return lxml.html.document_fromstring(content)
+        except ValueError:
+            return lxml.html.document_fromstring(_XML_DECLARATION.sub("", content, count=1))
+    except (etree.ParserError, ValueError):
+        return None
+
+
+# Parse a whole bioRxiv page (detail, search listing or article metrics) into
+# one PageRecord; pages that cannot be parsed give an empty record
+def extract_page(content, base_url="https://www.biorxiv.org"):
+    if not content or not content.strip():
+        return PageRecord()
+    tree = _parse_tree(content)
+    if tree is None:
+        return PageRecord()
+    record = PageRecord()
+
+    title = _first_text(_TITLE, tree) or next(iter(_META_TITLE(tree)), None)
+    if title:
+        record.title = title
+    abstract = _first_text(_ABSTRACT, tree)
+    if abstract:
+        record.abstract = abstract
+    record.date = parse_posted_date(_first_text(_DATE, tree))
+    record.subject_areas = [_text(a) for a in _SUBJECT_AREAS(tree)]
+
+    for name, xpath in _METRICS.items():
+        value = _first_text(xpath, tree)
+        if value and value.replace(",", "").isdigit():
+            record.metrics[name] = int(value.replace(",", ""))
+    record.metrics.update(_usage_totals(tree))
+
+    for doi_link in _META_DOI(tree):
+        doi = normalize_doi(doi_link)
+        if doi and doi not in record.dois:
+            record.dois.append(doi)
+    for span in _LISTING_DOIS(tree):
+        doi = normalize_doi(_text(span))
+        if not doi:
+            continue
+        if doi not in record.dois:
+            record.dois.append(doi)
+        item = next(iter(_LISTING_ITEM(span)), None)
+        if item is not None:
+            date_element = next(iter(_LISTING_DATE(item)), None)
+            posted = parse_posted_date(_text(date_element if date_element is not None else item))
+            if posted:
+                record.posted_dates.setdefault(doi, posted)
+
+    for href in _PAGER_LINKS(tree):
+        record.pagination_urls.append(href if href.startswith("http") else f"{base_url}{href}")
+    return record
+
+
+# Parse a page with the compiled extractor on a worker thread, so large pages
+# do not block other coroutines on the event loop
+async def extract_page_async(content):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, extract_page, content)
@@ -1,19 +1,44 @@
-import requests
+import asyncio
 import json
 import os
+import time
+import aiohttp
 from dotenv import load_dotenv
 from openai import OpenAI
+from cache import get_cache
+from emails import find_emails, plausible_email
 
 # Load environment variables from .env file
 load_dotenv()
 
+GITHUB_API_URL = "https://api.github.com"
 
-def extract_emails(content):
+
+# Author emails from paper text. The deterministic extractor in emails.py
+# does the work; only snippets it could not make sense of (at most
+# max_leftover_chars of them) go to the LLM, and addresses it returns are
+# kept only if they actually occur in those snippets.
+def extract_emails(content, use_llm=True, max_leftover_chars=2000):
+    emails, leftovers = find_emails(content)
+    if not leftovers or not use_llm:
+        return emails
+
+    snippets = "\n---\n".join(leftovers)[:max_leftover_chars]
+    try:
+        for email in extract_emails_llm(snippets):
+            if plausible_email(email, snippets) and email.lower() not in emails:
+                emails.append(email.lower())
+    except Exception as e:
+        print(f"LLM email fallback failed: {e}")
+    return emails
+
+
+def extract_emails_llm(content):
     api_key = os.getenv("OPENAI_API_KEY")
     client = OpenAI(api_key=api_key)
 
     prompt = f"""
-    You are given a research paper. Extract all the emails of authors from the paper if they are available.
+    You are given snippets from a research paper. Extract all the emails of authors from the snippets if they are available.
 
     Return your response in JSON format as following:
 
@@ -23,7 +48,7 @@ def extract_emails(content):
 
     in the case there are no emails, return an empty list.
 
-    here is the paper:
+    here are the snippets:
 
     {content}
     """
@@ -37,42 +62,133 @@ def extract_emails(content):
     return json.loads(response.choices[0].message.content)["emails"]
 
 
-def check_github_email(email):
-    url = f"https://api.github.com/search/users?q={email}+in:email+type:user"
-    response = requests.get(url)
+# Async GitHub lookups for author emails. Connections are pooled in one
+# aiohttp session and at most max_concurrency requests run at once. Responses
+# go into the paper cache (github:<kind>:<query>) with their ETag: entries
+# younger than ttl_days are used as is, older ones are revalidated with
+# If-None-Match, and a 304 does not count against the rate limit. Once
+# X-RateLimit-Remaining reaches 0 for a resource (search or core), lookups
+# against it return nothing until the client is recreated. base_url can
+# point at a local stand-in API.
+class GitHubClient:
+    def __init__(self, http=None, base_url=GITHUB_API_URL, token=None, cache=None, ttl_days=7, max_concurrency=4):
+        self.http = http
+        self._owns_http = http is None
+        self.base_url = base_url.rstrip("/")
+        self.token = token or os.getenv("GITHUB_TOKEN")
+        self.cache = cache or get_cache()
+        self.ttl = ttl_days * 86400
+        self.max_concurrency = max_concurrency
+        self.exhausted = set()
+        self._semaphore = None
+
+    async def __aenter__(self):
+        if self.http is None:
+            headers = {"Accept": "application/vnd.github+json"}
+            if self.token:
+                headers["Authorization"] = f"Bearer {self.token}"
+            self.http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=30),
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._owns_http and self.http is not None:
+            await self.http.close()
+            self.http = None
+
+    @staticmethod
+    def _resource(url):
+        return "search" if "/search/" in url else "core"
+
+    # GET a JSON document, going through the cache; None when it is not
+    # available (error, or rate limit used up)
+    async def _get_json(self, url, cache_key, params=None):
+        cache_key = f"github:{cache_key}"
+        loop = asyncio.get_event_loop()
+        entry = await loop.run_in_executor(None, self.cache.get_json, cache_key)
+        if entry and time.time() - entry["fetched"] < self.ttl:
+            return entry["value"]
+        resource = self._resource(url)
+        if resource in self.exhausted:
+            return entry["value"] if entry else None
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        headers = {"If-None-Match": entry["etag"]} if entry and entry.get("etag") else {}
+        async with self._semaphore:
+            if resource in self.exhausted:  # Ran out while this one was queued
+                return entry["value"] if entry else None
+            try:
+                async with self.http.get(url, params=params, headers=headers) as response:
+                    self._track_rate_limit(resource, response)
+                    if response.status == 304 and entry:
+                        value = entry["value"]
+                    elif response.status == 200:
+                        value = await response.json(content_type=None)
+                    else:
+                        print(f"Error: {response.status}, {await response.text()}")
+                        return entry["value"] if entry else None
+                    etag = response.headers.get("ETag")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"GitHub request to {url} failed: {e}")
+                return entry["value"] if entry else None
+        await loop.run_in_executor(None, self.cache.put_json, cache_key, {"etag": etag, "fetched": time.time(), "value": value})
+        return value
+
+    def _track_rate_limit(self, resource, response):
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            resource = response.headers.get("X-RateLimit-Resource", resource)
+            if resource not in self.exhausted:
+                reset = response.headers.get("X-RateLimit-Reset", "?")
+                print(f"GitHub {resource} rate limit used up (resets at {reset}); skipping further lookups")
+            self.exhausted.add(resource)
+
+    # API URLs of the users with this public email
+    async def users_for_email(self, email):
+        data = await self._get_json(
+            f"{self.base_url}/search/users",
+            f"email:{email.lower()}",
+            params={"q": f"{email} in:email type:user"},
+        )
+        return [user["url"] for user in (data or {}).get("items", [])]
+
+    async def twitter_username(self, user_url):
+        data = await self._get_json(user_url, f"user:{user_url}")
+        return (data or {}).get("twitter_username") or None
+
+    # Twitter handles of the GitHub users behind these emails, in email order
+    async def twitter_handles(self, emails):
+        user_lists = await asyncio.gather(*(self.users_for_email(email) for email in emails))
+        user_urls = list(dict.fromkeys(url for urls in user_lists for url in urls))
+        handles = await asyncio.gather(*(self.twitter_username(url) for url in user_urls))
+        return list(dict.fromkeys(handle for handle in handles if handle))
+
+
+async def _lookup(method, *args):
+    async with GitHubClient() as client:
+        return await getattr(client, method)(*args)
 
-    if response.status_code == 200:
-        data = response.json()
-        return data["items"]
-    else:
-        print(f"Error: {response.status_code}, {response.text}")
-        return None
+
+def check_github_email(email):
+    return asyncio.run(_lookup("users_for_email", email))
 
 
 def get_profile_data(user_url):
-    response = requests.get(user_url)
-    if response.status_code == 200:
-        profile_data = response.json()
-        return profile_data.get("twitter_username", None)
-    else:
-        print(f"Error: {response.status_code}, {response.text}")
-        return None
+    return asyncio.run(_lookup("twitter_username", user_url))
+
+
+async def find_twitter_handles(emails, client=None):
+    if client is not None:
+        return await client.twitter_handles(emails)
+    async with GitHubClient() as client:
+        return await client.twitter_handles(emails)
 
 
 def process_paper(content):
     emails = extract_emails(content)
-    twitter_handles = []
-
     if not emails:
-        return twitter_handles
-
-    for email in emails:
-        users = check_github_email(email)
-
-        if users:
-            for user in users:
-                github_profile_url = user["url"]
-                twitter_handle = get_profile_data(github_profile_url)
-                if twitter_handle:
-                    twitter_handles.append(twitter_handle)
-    return twitter_handles
+        return []
+    return asyncio.run(find_twitter_handles(emails))
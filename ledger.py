@@ -0,0 +1,161 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from cache import DEFAULT_CACHE_DIR
+from extract import normalize_doi
+from render import EncodedImage
+
+# Per-paper stages in pipeline order. "posting" is set right before the tweet
+# is sent, so a crash mid-post never leads to a second tweet.
+STAGES = ("scraped", "extracted", "summarized", "rendered", "posting", "posted")
+
+# Fields that are not kept in the ledger: the full text lives in the paper
+# cache and the card has its own column
+_TRANSIENT_FIELDS = ("full_text", "full_text_tokens", "card")
+
+
+def paper_doi(paper):
+    return paper.get("doi") or normalize_doi(paper["url"]) or paper["url"]
+
+
+# Durable record of the daily runs, so a crashed run can be resumed. Each run
+# (keyed by the posting date) stores its final ranking once the scrape is
+# done, and each paper (keyed by DOI, across runs) its furthest stage plus
+# what later stages need: the summary, the rendered card and the tweet ID.
+# Batch API jobs are recorded with their papers until a later run collects
+# them.
+class RunLedger:
+    def __init__(self, path=os.path.join(DEFAULT_CACHE_DIR, "ledger.sqlite")):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS runs (run_date TEXT PRIMARY KEY, ranking TEXT NOT NULL, created REAL NOT NULL)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS papers ("
+                "doi TEXT PRIMARY KEY, run_date TEXT, stage TEXT NOT NULL, paper TEXT NOT NULL, "
+                "card BLOB, card_meta TEXT, tweet_id TEXT, error TEXT, updated REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS batches ("
+                "batch_id TEXT PRIMARY KEY, source TEXT NOT NULL, papers TEXT NOT NULL, status TEXT, created REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    # Final ranking of a run, or None if its scrape never finished
+    def ranking(self, run_date):
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT ranking FROM runs WHERE run_date = ?", (run_date,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record_ranking(self, run_date, papers):
+        papers = [{k: v for k, v in paper.items() if k not in _TRANSIENT_FIELDS} for paper in papers]
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO runs (run_date, ranking, created) VALUES (?, ?, ?)",
+                (run_date, json.dumps(papers, default=str), time.time()),
+            )
+
+    def stage(self, paper):
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT stage FROM papers WHERE doi = ?", (paper_doi(paper),)).fetchone()
+        return row[0] if row else None
+
+    # Register a scraped paper and return it merged with what earlier runs
+    # already produced for it (summary, card), plus its stage
+    def resume(self, paper, run_date):
+        doi = paper_doi(paper)
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT stage, paper, card, card_meta FROM papers WHERE doi = ?", (doi,)).fetchone()
+            if row is None:
+                db.execute(
+                    "INSERT INTO papers (doi, run_date, stage, paper, updated) VALUES (?, ?, 'scraped', ?, ?)",
+                    (doi, run_date, self._dump(paper), time.time()),
+                )
+                return "scraped", paper
+        stage, stored, card, card_meta = row
+        paper = dict(json.loads(stored), **paper)
+        if card is not None:
+            paper["card"] = EncodedImage(card, *json.loads(card_meta))
+        return stage, paper
+
+    # Move a paper forward to `stage`, storing its current fields; stages
+    # never move backwards
+    def advance(self, paper, stage):
+        card = paper.get("card")
+        card_data = card_meta = None
+        if isinstance(card, EncodedImage):
+            card_data = card.data
+            card_meta = json.dumps([card.format, card.quality, card.subsampling])
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT stage FROM papers WHERE doi = ?", (paper_doi(paper),)).fetchone()
+            if row and STAGES.index(row[0]) > STAGES.index(stage):
+                return
+            db.execute(
+                "UPDATE papers SET stage = ?, paper = ?, card = COALESCE(?, card), card_meta = COALESCE(?, card_meta), "
+                "error = NULL, updated = ? WHERE doi = ?",
+                (stage, self._dump(paper), card_data, card_meta, time.time(), paper_doi(paper)),
+            )
+
+    def record_error(self, paper, error):
+        with self._lock, self._connect() as db:
+            db.execute(
+                "UPDATE papers SET error = ?, updated = ? WHERE doi = ?",
+                (str(error), time.time(), paper_doi(paper)),
+            )
+
+    # Claim a paper for posting; False if it was posted (or a post was
+    # attempted) before, in this run or any other
+    def begin_post(self, paper):
+        with self._lock, self._connect() as db:
+            cursor = db.execute(
+                "UPDATE papers SET stage = 'posting', updated = ? WHERE doi = ? AND stage NOT IN ('posting', 'posted')",
+                (time.time(), paper_doi(paper)),
+            )
+            return cursor.rowcount == 1
+
+    # Twitter rejected the post, so it is safe to try again in a later run
+    def abort_post(self, paper, error):
+        with self._lock, self._connect() as db:
+            db.execute(
+                "UPDATE papers SET stage = 'rendered', error = ?, updated = ? WHERE doi = ? AND stage = 'posting'",
+                (str(error), time.time(), paper_doi(paper)),
+            )
+
+    def record_post(self, paper, tweet_id):
+        with self._lock, self._connect() as db:
+            db.execute(
+                "UPDATE papers SET stage = 'posted', tweet_id = ?, error = NULL, updated = ? WHERE doi = ?",
+                (str(tweet_id), time.time(), paper_doi(paper)),
+            )
+
+    # A submitted Batch API job. papers maps each request's custom_id to
+    # {"paper": paper dict, "cache_key": summary cache key}.
+    def record_batch(self, batch_id, source, papers):
+        papers = {
+            key: dict(entry, paper={k: v for k, v in entry["paper"].items() if k not in _TRANSIENT_FIELDS})
+            for key, entry in papers.items()
+        }
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO batches (batch_id, source, papers, status, created) VALUES (?, ?, ?, NULL, ?)",
+                (batch_id, source, json.dumps(papers, default=str), time.time()),
+            )
+
+    # Batches not collected yet, oldest first, as (batch_id, source, papers)
+    def open_batches(self):
+        with self._lock, self._connect() as db:
+            rows = db.execute("SELECT batch_id, source, papers FROM batches WHERE status IS NULL ORDER BY created").fetchall()
+        return [(batch_id, source, json.loads(papers)) for batch_id, source, papers in rows]
+
+    def close_batch(self, batch_id, status):
+        with self._lock, self._connect() as db:
+            db.execute("UPDATE batches SET status = ? WHERE batch_id = ?", (status, batch_id))
+
+    @staticmethod
+    def _dump(paper):
+        return json.dumps({k: v for k, v in paper.items() if k not in _TRANSIENT_FIELDS}, default=str, sort_keys=True)
@@ -1,31 +1,376 @@
+import argparse
 import asyncio
-import time
-from bioarxiv import get_trending_urls
-from ai import create_image_from_paper_info
-from post import post_tweet
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from bioarxiv import get_yesterday_date
+from cache import get_cache
+from pdf_text import ExtractionPool
+from summarizer import AsyncSummarizer, BatchSummarizer
+from render import DEFAULT_MAX_BYTES, CardJob, render_job
+from sources import BIORXIV, SOURCES, get_source
+import tweepy
+from ledger import RunLedger
+from post import TwitterPoster
 
+# Marks the end of a stage's input
+DONE = object()
 
-async def main():
-    top_ten_tweets = await get_trending_urls()  # Await the asynchronous function
-    print("top_ten_tweets", top_ten_tweets)
+# Answers that mean Twitter created no tweet; any other failure leaves the
+# post's outcome unknown
+REJECTED_POST_ERRORS = (tweepy.BadRequest, tweepy.Unauthorized, tweepy.Forbidden, tweepy.TooManyRequests)
 
-    for tweet in top_ten_tweets:
-        paper_info = {
-            "url": tweet["url"],
-            "tweet_count": tweet["tweet_count"],
-            "abstract": tweet["abstract"],
-            "title": tweet["title"],
-            "subject_area": tweet["subject_area"],
-        }
 
-        output_path = create_image_from_paper_info(paper_info)
+# Run `handler` over every item from inbox with `concurrency` workers and pass
+# non-None results to outbox. Bounded queues give back-pressure: a stage
+# waits when the next one falls behind. on_drop(item) is called for items
+# that failed or produced nothing.
+async def run_stage(name, inbox, outbox, handler, concurrency, on_drop):
+    async def worker():
+        while True:
+            item = await inbox.get()
+            if item is DONE:
+                await inbox.put(DONE)  # Let the sibling workers stop too
+                return
+            try:
+                result = await handler(item)
+            except Exception as e:
+                print(f"{name} failed for {item['url']}: {e}")
+                result = None
+            if result is None:
+                on_drop(item)
+            else:
+                await outbox.put(result)
 
-        # Post the tweet with the image
-        post_tweet(paper_info["title"], paper_info["url"], output_path)
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await outbox.put(DONE)
 
-        print(f"Image saved at: {output_path}")
-        #print(f"Twitter handles: {twitter_handles}")
 
-# Entry point for the script
+# Download and extract paper text; PDF bytes stay in a spool file and the
+# CPU-bound extraction runs in the process pool. Cache reads and writes
+# (SQLite, blob files, eviction) run on a worker thread, off the event loop.
+async def extract_paper(paper, pool, token_limit):
+    if "summary" in paper:  # Resumed past this stage
+        return paper
+    loop = asyncio.get_event_loop()
+    source = get_source(paper)
+    cache = get_cache()
+    key = source.key(paper)
+    text_key = f"text:{key}:{token_limit}"
+
+    def lookup():
+        cache.put_json(f"paper:{key}", paper)
+        return cache.get_text(text_key)
+
+    text = await loop.run_in_executor(None, lookup)
+    tokens = None
+    if text is None:
+        result = await pool.fetch_paper_text(source.pdf_url(paper), token_limit)
+        if result is None:
+            return None
+        text, tokens = result
+        await loop.run_in_executor(None, cache.put, text_key, text)
+    return dict(paper, full_text=text, full_text_tokens=tokens)
+
+
+async def summarize_paper(paper, summarizer):
+    if "summary" in paper:
+        return paper
+    summary = await summarizer.summarize(paper["full_text"], get_source(paper).name, paper["full_text_tokens"])
+    return dict(paper, summary=summary)
+
+
+async def render_paper(paper, executor, max_bytes):
+    if paper.get("card") is not None:
+        return paper
+    source = get_source(paper)
+    job = CardJob(source.key(paper), paper["title"], paper["summary"], source.footer_text(paper))
+    loop = asyncio.get_event_loop()
+    card = await loop.run_in_executor(executor, render_job, source.renderer_args(), job, max_bytes)
+    return dict(paper, card=card)
+
+
+# Record each paper that makes it through a stage in the ledger, and the
+# reason for each one that does not
+def checkpointed(ledger, stage, handler):
+    async def run(paper):
+        try:
+            result = await handler(paper)
+        except Exception as e:
+            ledger.record_error(paper, f"{stage}: {e}")
+            raise
+        if result is None:
+            ledger.record_error(paper, f"{stage}: no result")
+        else:
+            ledger.advance(result, stage)
+        return result
+
+    return run
+
+
+# Post a feed's rendered papers in rank order, each as soon as its card is
+# uploaded. cards and media map paper urls to futures of the rendered paper
+# and of its media ID.
+async def post_ranking(ranking, cards, media, poster, ledger):
+    loop = asyncio.get_event_loop()
+    for tweet in ranking:
+        if ledger.stage(tweet) in ("posting", "posted"):
+            print(f"Skipping {tweet['url']}: already posted")
+            continue
+        paper = await cards[tweet["url"]] if tweet["url"] in cards else None
+        if paper is None:
+            print(f"Skipping {tweet['url']}: no card was produced")
+            continue
+        try:
+            media_id = await media[paper["url"]]
+        except Exception as e:
+            print(f"Media upload failed for {paper['url']}: {e}")
+            ledger.record_error(paper, f"upload: {e}")
+            continue
+        if not ledger.begin_post(paper):
+            continue
+        try:
+            tweet_id = await loop.run_in_executor(None, poster.post, paper["title"], paper["url"], media_id)
+        except REJECTED_POST_ERRORS as e:
+            # Twitter refused the tweet, so nothing was posted
+            print(f"Posting failed for {paper['url']}: {e}")
+            ledger.abort_post(paper, e)
+            continue
+        except Exception as e:
+            # A 5xx, a dropped connection or anything else: the tweet may or
+            # may not have gone out, so leave the paper marked as posting so
+            # it is never tweeted twice
+            print(f"Posting failed for {paper['url']}, not retrying: {e}")
+            ledger.record_error(paper, f"post: {e}")
+            continue
+        ledger.record_post(paper, tweet_id)
+        print(f"Posted card for {paper['url']}")
+
+
+# Staged pipeline: scrape -> rank -> download/extract -> summarize -> render ->
+# post. A paper enters the pipeline as soon as its top-ten place is certain,
+# so paper #1 can be downloading while paper #2 is being summarized. Each card
+# is uploaded as soon as it is rendered; tweets still go out in final rank
+# order, at least post_spacing seconds apart.
+#
+# feeds maps source names (see sources.py) to the options of their feed, e.g.
+# {"bioarxiv": {}, "arxiv": {"ids": [...]}}. All feeds run in this one
+# process and share the PDF pool, the summarizer's rate-limit budget, the
+# render pool and the caches; each posts with its own account (posters maps
+# source names to TwitterPosters).
+#
+# Progress is checkpointed in the run ledger. A rerun for the same day skips
+# the scrape, picks every paper up after its last completed stage, and never
+# posts a DOI that was posted (or attempted) before. Summaries from finished
+# --batch jobs are collected first (see collect_batches). A failed feed does not
+# stop the others; its error is raised once they are done, so the run fails.
+async def main(
+    feeds=None,
+    extract_processes=2,
+    extract_concurrency=4,
+    summarize_concurrency=4,
+    render_processes=2,
+    token_limit=120000,
+    max_bytes=DEFAULT_MAX_BYTES,
+    post_spacing=0.0,
+    posters=None,
+    ledger=None,
+    run_date=None,
+):
+    loop = asyncio.get_event_loop()
+    feeds = feeds or {BIORXIV.name: {}}
+    run_date = run_date or get_yesterday_date()
+    ledger = ledger or RunLedger()
+    await collect_batches(ledger)  # Summaries from earlier --batch runs
+    to_extract = asyncio.Queue()  # Only each feed's top papers are released
+    to_summarize = asyncio.Queue(maxsize=2 * summarize_concurrency)
+    to_render = asyncio.Queue(maxsize=2 * render_processes)
+    rendered = asyncio.Queue()
+    cards = {}  # paper url -> future resolved with the rendered paper or None
+    media = {}  # paper url -> future resolved with the uploaded media ID
+    posters = dict(posters or {})
+    for name in feeds:
+        if name not in posters:
+            posters[name] = TwitterPoster(spacing=post_spacing, env_prefix=SOURCES[name].twitter_env_prefix)
+    upload_workers = sum(posters[name].upload_workers for name in feeds)
+
+    def release(source, paper):
+        stage, paper = ledger.resume(dict(paper, source=source.name), run_date)
+        if stage in ("posting", "posted"):
+            return
+        cards[paper["url"]] = loop.create_future()
+        to_extract.put_nowait(paper)
+
+    def drop(paper):
+        future = cards.get(paper["url"])
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    async def collect():
+        while True:
+            paper = await rendered.get()
+            if paper is DONE:
+                return
+            poster = posters[get_source(paper).name]
+            media[paper["url"]] = loop.run_in_executor(upload_executor, poster.upload, paper["card"])
+            cards[paper["url"]].set_result(paper)
+
+    unranked = [len(feeds)]  # Feeds still releasing papers
+
+    # Rank (or resume) one feed, then post it. Extraction stops taking input
+    # once every feed has released its papers.
+    async def run_feed(name, options):
+        source = SOURCES[name]
+        run_key = f"{name}:{run_date}"
+        try:
+            ranking = ledger.ranking(run_key)
+            if ranking is not None:
+                print(f"Resuming the {name} run for {run_date}")
+                for paper in ranking:
+                    release(source, paper)
+            else:
+                ranking = await source.feed(run_date, lambda paper: release(source, paper), **options)
+                ledger.record_ranking(run_key, ranking)
+        finally:
+            unranked[0] -= 1
+            if not unranked[0]:
+                to_extract.put_nowait(DONE)
+        print(f"{name} ranking", ranking)
+        await post_ranking(ranking, cards, media, posters[name], ledger)
+
+    summarizer = AsyncSummarizer(max_concurrency=summarize_concurrency)
+    with ExtractionPool(extract_processes) as pool, ProcessPoolExecutor(render_processes) as render_executor, ThreadPoolExecutor(upload_workers) as upload_executor:
+        stages = asyncio.gather(
+            run_stage("Extraction", to_extract, to_summarize, checkpointed(ledger, "extracted", lambda p: extract_paper(p, pool, token_limit)), extract_concurrency, drop),
+            run_stage("Summarization", to_summarize, to_render, checkpointed(ledger, "summarized", lambda p: summarize_paper(p, summarizer)), summarize_concurrency, drop),
+            run_stage("Rendering", to_render, rendered, checkpointed(ledger, "rendered", lambda p: render_paper(p, render_executor, max_bytes)), render_processes, drop),
+            collect(),
+        )
+        try:
+            results = await asyncio.gather(*(run_feed(name, options) for name, options in feeds.items()), return_exceptions=True)
+        finally:
+            await stages
+        failures = [result for result in results if isinstance(result, Exception)]
+        for name, result in zip(feeds, results):
+            if isinstance(result, Exception):
+                print(f"The {name} feed failed: {result}")
+        # The other feeds still posted; fail the run (and the scheduled job)
+        # so the failed feed gets rerun
+        if failures:
+            raise failures[0]
+
+
+# Candidates per bioRxiv run that batch mode summarizes (the daily run posts
+# the top ten of them)
+BATCH_TOP_K = 200
+
+
+# Collect the Batch API jobs submitted by earlier runs that have finished:
+# their summaries go into the ledger (and the summary cache), so those papers
+# skip summarization when they come up for posting. Jobs still running are
+# left for a later run; nothing here waits.
+async def collect_batches(ledger, summarizer=None):
+    loop = asyncio.get_event_loop()
+    for batch_id, name, papers in ledger.open_batches():
+        summarizer = summarizer or BatchSummarizer()
+        try:
+            batch = await loop.run_in_executor(None, summarizer.poll, batch_id)
+            if batch is None:
+                print(f"Batch {batch_id} is still running")
+                continue
+            cache_keys = {key: entry["cache_key"] for key, entry in papers.items()}
+            summaries = await loop.run_in_executor(None, summarizer.finish, batch, cache_keys)
+        except Exception as e:
+            print(f"Could not collect batch {batch_id}: {e}")
+            continue
+        for key, summary in summaries.items():
+            paper = papers[key]["paper"]
+            if summary is None:
+                ledger.record_error(paper, "summarized: no usable summary in the batch")
+            else:
+                ledger.advance(dict(paper, summary=summary), "summarized")
+        ledger.close_batch(batch_id, batch.status)
+        print(f"Collected {sum(s is not None for s in summaries.values())} of {len(papers)} {name} summaries from batch {batch_id}")
+
+
+# Batch mode for backfills and wider daily coverage: collect finished batches,
+# rank (or resume) each feed's candidate set (top_k bioRxiv papers rather than
+# the ten that get posted), extract every candidate that still needs a
+# summary and is not in a running batch, and submit them as one Batch API job
+# per source. Returns without waiting: a later run (batch mode or main())
+# collects the results, which the ledger keeps with the batch id.
+async def summarize_in_batch(feeds=None, top_k=BATCH_TOP_K, extract_processes=2, extract_concurrency=4, token_limit=120000, ledger=None, summarizer=None, run_date=None):
+    loop = asyncio.get_event_loop()
+    feeds = feeds or {BIORXIV.name: {}}
+    run_date = run_date or get_yesterday_date()
+    ledger = ledger or RunLedger()
+    summarizer = summarizer or BatchSummarizer()
+    await collect_batches(ledger, summarizer)
+    batched = {key for _, _, papers in ledger.open_batches() for key in papers}
+
+    papers = []
+    for name, options in feeds.items():
+        source = SOURCES[name]
+        if source is BIORXIV:
+            options = dict(options, top_k=top_k)
+        # Kept apart from the run's posting ranking, which stays the top ten
+        candidates_key = f"{name}:{run_date}:candidates"
+        ranking = ledger.ranking(candidates_key)
+        if ranking is None:
+            ranking = await source.feed(run_date, lambda paper: None, **options)
+            ledger.record_ranking(candidates_key, ranking)
+        for paper in ranking:
+            stage, paper = ledger.resume(dict(paper, source=name), run_date)
+            if stage not in ("posting", "posted") and "summary" not in paper and source.key(paper) not in batched:
+                papers.append(paper)
+
+    semaphore = asyncio.Semaphore(extract_concurrency)
+    with ExtractionPool(extract_processes) as pool:
+        extract = checkpointed(ledger, "extracted", lambda p: extract_paper(p, pool, token_limit))
+
+        async def extract_one(paper):
+            async with semaphore:
+                try:
+                    return await extract(paper)
+                except Exception as e:
+                    print(f"Extraction failed for {paper['url']}: {e}")
+                    return None
+
+        extracted = [paper for paper in await asyncio.gather(*(extract_one(p) for p in papers)) if paper is not None]
+
+    async def submit_source(name):
+        candidates = {SOURCES[name].key(paper): paper for paper in extracted if paper["source"] == name}
+        if not candidates:
+            return
+        texts = {key: paper["full_text"] for key, paper in candidates.items()}
+        summaries, pending = await loop.run_in_executor(None, summarizer.prepare, texts, name)
+        for key, summary in summaries.items():
+            ledger.advance(dict(candidates[key], summary=summary), "summarized")
+        if not pending:
+            return
+        batch_id = await loop.run_in_executor(None, summarizer.submit_pending, pending, name)
+        ledger.record_batch(batch_id, name, {key: {"paper": candidates[key], "cache_key": cache_key} for key, (_, cache_key) in pending.items()})
+        print(f"Submitted {len(pending)} {name} papers as batch {batch_id} ({len(summaries)} were cached)")
+
+    await asyncio.gather(*(submit_source(name) for name in feeds))
+
+
+# Entry point for the script:
+#   python main.py [arxiv_id ...]
+#   python main.py --batch [--top-k N] [arxiv_id ...]
+# --batch submits the day's candidate set to the Batch API and exits without
+# posting; run it well before the posting run, which collects whatever has
+# finished by then.
 if __name__ == "__main__":
-    asyncio.run(main())  # Run the main function
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", action="store_true", help="summarize the candidate set through the Batch API")
+    parser.add_argument("--top-k", type=int, default=BATCH_TOP_K, help="bioRxiv candidates per batch run")
+    # Optional arXiv ids to post alongside the bioRxiv feed
+    parser.add_argument("arxiv_ids", nargs="*")
+    args = parser.parse_args()
+
+    feeds = {BIORXIV.name: {}}
+    if args.arxiv_ids:
+        feeds["arxiv"] = {"ids": args.arxiv_ids}
+    if args.batch:
+        asyncio.run(summarize_in_batch(feeds, args.top_k))
+    else:
+        asyncio.run(main(feeds))  # Run the main function
@@ -0,0 +1,178 @@
+import asyncio
+import functools
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+import requests
+import tiktoken
+
+from cache import DEFAULT_CACHE_DIR
+
+# tiktoken downloads its BPE files on first use. Keep them in the local cache
+# directory so later runs, and offline runners, load them from disk.
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.join(DEFAULT_CACHE_DIR, "tiktoken"))
+
+MAX_PDF_BYTES = 100 * 1024 * 1024
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Pooled keep-alive connections reused across papers
+http_session = requests.Session()
+http_session.headers["User-Agent"] = USER_AGENT
+http_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+# Stand-in for a tiktoken encoding when the BPE files cannot be loaded. Each
+# run of whitespace and each piece of up to four other characters counts as one
+# token, which is close to the BPE count for English text. Tokens are the text
+# pieces themselves, so slicing and decoding work as they do with tiktoken.
+class ApproximateEncoding:
+    name = "approximate"
+    _pieces = re.compile(r"\s+|\S{1,4}")
+
+    def encode_ordinary(self, text):
+        return self._pieces.findall(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def _load_encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+# One encoding object per model for the whole process. Unknown model names
+# fall back to cl100k_base instead of raising. tiktoken downloads its BPE files
+# on first use; when that fails (a cold or offline runner) token counts fall
+# back to an approximation instead of every paper being dropped.
+@functools.lru_cache(maxsize=None)
+def get_encoding(model="gpt-3.5-turbo"):
+    try:
+        return _load_encoding(model)
+    except Exception as e:
+        print(f"Could not load the tokenizer for {model}, counting tokens approximately: {e!r}")
+        return ApproximateEncoding()
+
+
+# Join page texts up to token_limit tokens. Each page is encoded once and a
+# running total is kept; only the page that crosses the limit is truncated.
+# Returns (text, token_count).
+def truncate_pages(page_texts, token_limit, model="gpt-3.5-turbo"):
+    encoding = get_encoding(model)
+    parts = []
+    total = 0
+    for page_text in page_texts:
+        tokens = encoding.encode_ordinary(page_text)
+        if total + len(tokens) > token_limit:
+            parts.append(encoding.decode(tokens[: token_limit - total]))
+            total = token_limit
+            break
+        parts.append(page_text)
+        total += len(tokens)
+        if total >= token_limit:
+            break
+    return "".join(parts), total
+
+
+# Stream a PDF in chunks to a temporary spool file so it never sits in memory
+# as one bytes object. Returns the file path, or None when the download fails
+# or the PDF is larger than max_bytes.
+def download_pdf(pdf_url, max_bytes=MAX_PDF_BYTES, timeout=(10, 60), chunk_size=64 * 1024):
+    try:
+        with http_session.get(pdf_url, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                print(f"Failed to download paper. Status code: {response.status_code}")
+                return None
+            if int(response.headers.get("Content-Length") or 0) > max_bytes:
+                print(f"Skipping {pdf_url}: PDF is larger than {max_bytes} bytes")
+                return None
+            size = 0
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as spool:
+                try:
+                    for chunk in response.iter_content(chunk_size):
+                        size += len(chunk)
+                        if size > max_bytes:
+                            break
+                        spool.write(chunk)
+                except BaseException:
+                    # A dropped connection (or a full disk) mid-download must
+                    # not leave the spool file behind
+                    spool.close()
+                    os.remove(spool.name)
+                    raise
+    except requests.RequestException as e:
+        print(f"Failed to download paper: {e}")
+        return None
+    if size > max_bytes:
+        os.remove(spool.name)
+        print(f"Skipping {pdf_url}: PDF is larger than {max_bytes} bytes")
+        return None
+    return spool.name
+
+
+# Yield the text of each page; PyMuPDF reads the file lazily, page by page
+def iter_page_texts(path):
+    with fitz.open(path) as doc:
+        for page in doc:
+            yield page.get_text()
+
+
+# Extract the text of a PDF file up to token_limit tokens.
+# Returns (text, token_count).
+def extract_text_file(path, token_limit, model="gpt-3.5-turbo"):
+    pages = iter_page_texts(path)
+    try:
+        return truncate_pages(pages, token_limit, model)
+    finally:
+        pages.close()
+
+
+# Download a PDF and return its text truncated to token_limit tokens. Pages
+# stop being extracted as soon as the token budget is met.
+def fetch_paper_text(pdf_url, token_limit, model="gpt-3.5-turbo", max_bytes=MAX_PDF_BYTES):
+    path = download_pdf(pdf_url, max_bytes)
+    if path is None:
+        return None
+    try:
+        text, _ = extract_text_file(path, token_limit, model)
+    finally:
+        os.remove(path)
+    return text
+
+
+# Pool of worker processes for CPU-bound PDF text extraction and token
+# counting. Only spool-file paths go to the workers, never PDF bytes; each
+# worker opens the file itself and sends back the truncated text and its
+# token count. Downloads run on threads, so the event loop stays free.
+class ExtractionPool:
+    def __init__(self, processes=None):
+        self._executor = ProcessPoolExecutor(max_workers=processes or os.cpu_count())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    async def extract(self, path, token_limit, model="gpt-3.5-turbo"):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, extract_text_file, path, token_limit, model)
+
+    # Async counterpart of fetch_paper_text; returns (text, token_count) or None
+    async def fetch_paper_text(self, pdf_url, token_limit, model="gpt-3.5-turbo", max_bytes=MAX_PDF_BYTES):
+        loop = asyncio.get_event_loop()
+        path = await loop.run_in_executor(None, download_pdf, pdf_url, max_bytes)
+        if path is None:
+            return None
+        try:
+            return await self.extract(path, token_limit, model)
+        finally:
+            os.remove(path)
@@ -1,55 +1,190 @@
 import tweepy
+import io
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from render import EncodedImage
 
 
-def post_tweet(title, url, image_path):
-    # Twitter API credentials
-    consumer_key = os.getenv("TWITTER_API_KEY")
-    consumer_secret = os.getenv("TWITTER_API_SECRET_KEY")
-    access_token = os.getenv("TWITTER_ACCESS_TOKEN")
-    access_token_secret = os.getenv("TWITTER_ACCESS_TOKEN_SECRET")
-    bearer_token = os.getenv("TWITTER_BEARER_TOKEN")
-
-    # Authenticate with Twitter using API v1.1
-    auth = tweepy.OAuth1UserHandler(
-        consumer_key, consumer_secret, access_token, access_token_secret
-    )
-
-    # Create API object for media upload
-    api = tweepy.API(auth)
-
-    # Create Client object for posting the tweet (v2) with bearer token
-    client = tweepy.Client(
-        bearer_token=bearer_token,
-        consumer_key=consumer_key,
-        consumer_secret=consumer_secret,
-        access_token=access_token,
-        access_token_secret=access_token_secret,
-    )
+# Uploads are safe to repeat (an orphaned media ID just expires), so they are
+# retried on rate limits, Twitter-side failures and transport errors, which
+# tweepy.API wraps in a bare TweepyException. 4xx answers fail at once.
+def upload_retryable(error):
+    if isinstance(error, (tweepy.TooManyRequests, tweepy.TwitterServerError)):
+        return True
+    return isinstance(error, tweepy.TweepyException) and not isinstance(error, tweepy.HTTPException)
+
+
+# Creating a tweet is not idempotent: after a 5xx or a dropped connection the
+# tweet may already exist. Only a 429 guarantees nothing was created.
+def tweet_retryable(error):
+    return isinstance(error, tweepy.TooManyRequests)
 
+
+# Unix time a 429 lifts, from the exception or its x-rate-limit-reset header
+def rate_limit_reset(error):
+    reset_time = getattr(error, "reset_time", None)
+    if reset_time is None:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        reset_time = headers.get("x-rate-limit-reset")
     try:
-        # Upload image
-        media = api.media_upload(image_path)
+        return int(reset_time)
+    except (TypeError, ValueError):
+        return None
 
-        # Print media ID
-        print("Media ID:", media.media_id)
 
-        # Prepare tweet text
-        tweet_text = f"🏷️:{title}\n\n"
+def tweet_text(title, url):
+    # Prepare tweet text
+    text = f"🏷️:{title}\n\n"
+
+    # Add Twitter handles if the list is not empty
+    # if twitter_handles:
+    #     formatted_handles = " ".join([f"@{handle}" for handle in twitter_handles])
+    #     text += f"👤:{formatted_handles}\n\n"
+
+    return text + f"🔗:{url}"
+
+
+# Long-lived Twitter client. The v1.1 API object (media upload) and the v2
+# Client (tweets) are built once and reuse their HTTP sessions. 429s are
+# retried after the x-rate-limit-reset time when Twitter sends one; uploads
+# are also retried with exponential backoff on server and connection errors,
+# tweets never are (see tweet_retryable).
+# Tweets are at least `spacing` seconds apart. Credentials come from the
+# <env_prefix>API_KEY, ... environment variables, so each feed can post to
+# its own account. Pass `api` and `client` to run against a mock.
+class TwitterPoster:
+    def __init__(self, api=None, client=None, spacing=0.0, max_retries=5, base_delay=2.0, max_delay=900.0, upload_workers=4, env_prefix="TWITTER_"):
+        if api is None or client is None:
+            # Twitter API credentials
+            consumer_key = os.getenv(f"{env_prefix}API_KEY")
+            consumer_secret = os.getenv(f"{env_prefix}API_SECRET_KEY")
+            access_token = os.getenv(f"{env_prefix}ACCESS_TOKEN")
+            access_token_secret = os.getenv(f"{env_prefix}ACCESS_TOKEN_SECRET")
+            bearer_token = os.getenv(f"{env_prefix}BEARER_TOKEN")
+
+        if api is None:
+            # Authenticate with Twitter using API v1.1 for media upload
+            auth = tweepy.OAuth1UserHandler(consumer_key, consumer_secret, access_token, access_token_secret)
+            api = tweepy.API(auth)
+        if client is None:
+            # Client object for posting the tweet (v2) with bearer token
+            client = tweepy.Client(
+                bearer_token=bearer_token,
+                consumer_key=consumer_key,
+                consumer_secret=consumer_secret,
+                access_token=access_token,
+                access_token_secret=access_token_secret,
+            )
+
+        self.api = api
+        self.client = client
+        self.spacing = spacing
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.upload_workers = upload_workers
+        self._post_lock = threading.Lock()
+        self._last_post = None
 
-        # Add Twitter handles if the list is not empty
-        # if twitter_handles:
-        #     formatted_handles = " ".join([f"@{handle}" for handle in twitter_handles])
-        #     tweet_text += f"👤:{formatted_handles}\n\n"
+    # Call func(), retrying errors for which retryable(error) holds;
+    # re-raises the last error and anything not retryable
+    def _call(self, func, what, retryable):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return func()
+            except tweepy.TweepyException as e:
+                if attempt == self.max_retries or not retryable(e):
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                if isinstance(e, tweepy.TooManyRequests):
+                    reset_time = rate_limit_reset(e)
+                    if reset_time is not None:
+                        delay = min(self.max_delay, max(0, reset_time - time.time()) + 1)
+                print(f"{what} failed ({e}), retrying in {delay:.0f}s")
+                time.sleep(delay)
 
-        tweet_text += f"🔗:{url}"
+    # Upload one card (file path or in-memory EncodedImage); returns the media ID
+    def upload(self, image):
+        def attempt():
+            # A fresh buffer per attempt, since a failed upload may have read it
+            if isinstance(image, EncodedImage):
+                return self.api.media_upload(filename=f"card.{image.extension}", file=io.BytesIO(image.data))
+            return self.api.media_upload(image)
 
-        # Create tweet with uploaded image using Client (v2)
-        tweet = client.create_tweet(text=tweet_text, media_ids=[media.media_id])
+        media = self._call(attempt, "Media upload", upload_retryable)
+        print("Media ID:", media.media_id)
+        return media.media_id
+
+    # Upload several cards concurrently; returns media IDs in the same order,
+    # None where an upload failed for good
+    def upload_all(self, images):
+        def upload_or_none(image):
+            try:
+                return self.upload(image)
+            except Exception as e:
+                print("Error uploading media:", e)
+                return None
+
+        with ThreadPoolExecutor(max(1, min(self.upload_workers, len(images)))) as executor:
+            return list(executor.map(upload_or_none, images))
 
+    # Post a tweet with already uploaded media; returns the tweet ID
+    def post(self, title, url, media_id):
+        with self._post_lock:
+            if self._last_post is not None:
+                wait = self._last_post + self.spacing - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            try:
+                tweet = self._call(
+                    lambda: self.client.create_tweet(text=tweet_text(title, url), media_ids=[media_id]),
+                    "Tweet",
+                    tweet_retryable,
+                )
+            finally:
+                self._last_post = time.monotonic()
         print("Tweet posted successfully! Tweet ID:", tweet.data["id"])
+        return tweet.data["id"]
+
+    # Upload and post one card; returns the tweet ID or None on failure
+    def post_card(self, title, url, image):
+        try:
+            return self.post(title, url, self.upload(image))
+        except tweepy.Forbidden as e:
+            print("Error posting tweet:", e)
+        except Exception as e:
+            print("An error occurred:", e)
+        return None
+
+    # Post (title, url, image) triples in the given (rank) order. All media is
+    # uploaded up front, concurrently; returns the tweet IDs (None on failure).
+    def post_all(self, items):
+        media_ids = self.upload_all([image for _, _, image in items])
+        tweet_ids = []
+        for (title, url, _), media_id in zip(items, media_ids):
+            tweet_id = None
+            if media_id is not None:
+                try:
+                    tweet_id = self.post(title, url, media_id)
+                except Exception as e:
+                    print("Error posting tweet:", e)
+            tweet_ids.append(tweet_id)
+        return tweet_ids
+
 
-    except tweepy.Forbidden as e:
-        print("Error posting tweet:", e)
-    except Exception as e:
-        print("An error occurred:", e)
+_default_poster = None
+
+
+# Process-wide poster, built from the TWITTER_* environment variables
+def get_poster():
+    global _default_poster
+    if _default_poster is None:
+        _default_poster = TwitterPoster()
+    return _default_poster
+
+
+# image_path is a file path or an in-memory EncodedImage
+def post_tweet(title, url, image_path):
+    return get_poster().post_card(title, url, image_path)
@@ -0,0 +1,87 @@
+import heapq
+import itertools
+import math
+from datetime import datetime
+
+
+# Parse counts like "1,234" or 12; anything non-numeric counts as 0
+def to_count(value):
+    try:
+        return int(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return 0
+
+
+# Build a scoring function mixing log-scaled tweet and PDF download counts,
+# decayed by paper age (half-life in days) relative to `today` (default: now)
+def make_composite_score(tweet_weight=1.0, download_weight=0.5, half_life_days=3.0, today=None):
+    def score(record):
+        value = tweet_weight * math.log1p(to_count(record.get("tweet_count")))
+        value += download_weight * math.log1p(to_count(record.get("pdf_downloads")))
+        if half_life_days and record.get("date"):
+            try:
+                posted = datetime.strptime(record["date"], "%Y-%m-%d").date()
+            except ValueError:
+                return value
+            age = max(0, ((today or datetime.now().date()) - posted).days)
+            value *= 0.5 ** (age / half_life_days)
+        return value
+
+    return score
+
+
+composite_score = make_composite_score()
+
+
+def tweet_score(record):
+    return to_count(record.get("tweet_count"))
+
+
+# Bounded top-k heap fed one record at a time. Records that cannot make the
+# cut are dropped as soon as they are scored, so memory stays at k records.
+# Ties go to the record that arrived first.
+class TopKRanker:
+    def __init__(self, k=10, score=composite_score):
+        self.k = k
+        self.score = score
+        self._heap = []  # min-heap of (score, -arrival, record)
+        self._arrival = itertools.count()
+        self._released = set()
+
+    def __len__(self):
+        return len(self._heap)
+
+    # Lowest score currently in the top k (-inf until the heap is full)
+    @property
+    def threshold(self):
+        return self._heap[0][0] if len(self._heap) >= self.k else float("-inf")
+
+    # Score a record; returns True if it is (for now) in the top k
+    def push(self, record):
+        entry = (self.score(record), -next(self._arrival), record)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+            return True
+        if entry[:2] <= self._heap[0][:2]:
+            return False
+        heapq.heapreplace(self._heap, entry)
+        return True
+
+    def results(self):
+        return [record for _, _, record in sorted(self._heap, key=lambda e: e[:2], reverse=True)]
+
+    # Records whose top-k place is certain and that were not returned before.
+    # With `remaining` records still to come, the record at rank r stays in
+    # the top k if r + remaining < k, or if no remaining record can outscore it
+    # (its score is at least max_remaining_score).
+    def release_certain(self, remaining, max_remaining_score=None):
+        released = []
+        ranked = sorted(self._heap, key=lambda e: e[:2], reverse=True)
+        for rank, (score, arrival, record) in enumerate(ranked):
+            safe = rank + remaining < self.k
+            if max_remaining_score is not None and score >= max_remaining_score:
+                safe = True
+            if safe and arrival not in self._released:
+                self._released.add(arrival)
+                released.append(record)
+        return released
@@ -0,0 +1,400 @@
+import functools
+import io
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, NamedTuple, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_PATH = "fonts/Inika-Regular.ttf"
+WATERMARK_FONT_PATH = "fonts/Larabieb.ttf"
+ACCENT_COLOR = "#B31B1B"
+CARDS_DIR = "cards"
+DEFAULT_MAX_BYTES = 250 * 1024
+
+# Watermarks as (before, accent letter, after)
+BIORXIV_WATERMARK = ("@bio", "R", "xivGPT")
+ARXIV_WATERMARK = ("@ar", "X", "ivGPT")
+
+
+# Font objects per (path, size), shared by every renderer in the process
+@functools.lru_cache(maxsize=64)
+def load_font(path, size):
+    return ImageFont.truetype(path, size)
+
+
+# Memoized per-character advance widths for one font. Pillow's basic layout
+# does not kern, so a string's width is the sum of its characters' advances.
+class FontMetrics:
+    def __init__(self, font):
+        self.font = font
+        self._advances = {}
+
+    def width(self, text):
+        advances = self._advances
+        total = 0
+        for char in text:
+            advance = advances.get(char)
+            if advance is None:
+                advance = advances[char] = self.font.getlength(char)
+            total += advance
+        return total
+
+
+@functools.lru_cache(maxsize=64)
+def font_metrics(path, size):
+    return FontMetrics(load_font(path, size))
+
+
+# Greedy word wrap by measured pixel width; words wider than a line are split
+def wrap_pixels(text, metrics, max_width):
+    lines = []
+    current = ""
+    current_width = 0
+    space_width = metrics.width(" ")
+    for word in text.split():
+        word_width = metrics.width(word)
+        if current and current_width + space_width + word_width <= max_width:
+            current += " " + word
+            current_width += space_width + word_width
+            continue
+        if current:
+            lines.append(current)
+        current, current_width = word, word_width
+        while current_width > max_width and len(current) > 1:
+            cut = len(current) - 1
+            while cut > 1 and metrics.width(current[:cut]) > max_width:
+                cut -= 1
+            lines.append(current[:cut])
+            current = current[cut:]
+            current_width = metrics.width(current)
+    if current:
+        lines.append(current)
+    return lines
+
+
+# Everything the drawing code needs: (position, text, font) per draw call,
+# the font sizes that were chosen and whether the content fits the card
+@dataclass
+class LayoutPlan:
+    items: List[Tuple[Tuple[int, int], str, ImageFont.FreeTypeFont]] = field(default_factory=list)
+    title_size: int = 0
+    content_size: int = 0
+    fits: bool = True
+
+
+# Lays out the title and bullet points of a card. Text is wrapped by measured
+# pixel width and each line is measured once. When the content does not fit
+# between the top of the card and bottom_limit, both font sizes (and the line
+# spacing with them) shrink step by step, down to min_ratio of the base sizes.
+class CardLayout:
+    def __init__(
+        self,
+        width,
+        height,
+        bottom_limit,
+        scale_factor=2,
+        title_size=35,
+        content_size=20,
+        content_width_ratio=0.75,
+        min_ratio=0.5,
+    ):
+        self.width = width
+        self.height = height
+        self.bottom_limit = bottom_limit
+        self.scale_factor = scale_factor
+        self.title_size = title_size
+        self.content_size = content_size
+        self.content_width_ratio = content_width_ratio
+        self.min_ratio = min_ratio
+        self.margin = 50 * scale_factor
+
+    def plan(self, title, bullet_values):
+        ratio = 1.0
+        while True:
+            plan = self._plan_at(title, bullet_values, ratio)
+            if plan.fits or ratio <= self.min_ratio:
+                if not plan.fits:
+                    print(f"Card content does not fit even at {int(self.min_ratio * 100)}% font size")
+                return plan
+            ratio = max(self.min_ratio, ratio * 0.92)
+
+    def _plan_at(self, title, bullet_values, ratio):
+        scale_factor = self.scale_factor
+        title_size = max(1, round(self.title_size * scale_factor * ratio))
+        content_size = max(1, round(self.content_size * scale_factor * ratio))
+        plan = LayoutPlan(title_size=title_size, content_size=content_size)
+        title_metrics = font_metrics(FONT_PATH, title_size)
+        content_metrics = font_metrics(FONT_PATH, content_size)
+        max_width = self.width - (2 * self.margin)
+
+        y_text = 50 * scale_factor
+        for line in wrap_pixels(title, title_metrics, max_width):
+            bbox = title_metrics.font.getbbox(line)
+            line_width = bbox[2] - bbox[0]
+            line_height = bbox[3] - bbox[1]
+            plan.items.append((((self.width - line_width) // 2, y_text), line, title_metrics.font))
+            y_text += line_height + (10 * scale_factor)
+
+        line_step = round(25 * scale_factor * ratio)
+        paragraph_gap = round(20 * scale_factor * ratio)
+        bullet_width = content_metrics.width("• ")
+        content_width = max_width * self.content_width_ratio - bullet_width
+        wrapped = [wrap_pixels(value, content_metrics, content_width) for value in bullet_values]
+        line_widths = [content_metrics.width(line) for lines in wrapped for line in lines]
+
+        total_height = sum(len(lines) * line_step + paragraph_gap for lines in wrapped)
+        y = max((self.height - total_height) // 2, y_text + paragraph_gap)
+        plan.fits = y + total_height - paragraph_gap <= self.bottom_limit
+        bullet_start_x = int((self.width - max(line_widths, default=0) - bullet_width) // 2)
+
+        for lines in wrapped:
+            for i, line in enumerate(lines):
+                if i == 0:
+                    plan.items.append(((bullet_start_x, y), "•", content_metrics.font))
+                plan.items.append(((int(bullet_start_x + bullet_width), y + line_step * i), line, content_metrics.font))
+            y += line_step * len(lines) + paragraph_gap
+        return plan
+
+
+# Renders summary cards onto one background. The LANCZOS-upscaled background,
+# the fonts and the watermark are prepared once; each card starts from a copy
+# of the background and gets the watermark composited as a ready overlay.
+class CardRenderer:
+    def __init__(
+        self,
+        background_path="background.jpg",
+        watermark=BIORXIV_WATERMARK,
+        content_size=20,
+        scale_factor=2,
+        offset=20,
+        accent_color=ACCENT_COLOR,
+    ):
+        self.scale_factor = scale_factor
+        self.offset = offset
+        self.accent_color = accent_color
+        with Image.open(background_path) as img:
+            width, height = img.size
+            self.background = img.resize(
+                (width * scale_factor, height * scale_factor), Image.LANCZOS
+            )
+
+        self.footer_font = load_font(FONT_PATH, 20 * scale_factor)
+        self.watermark_font = load_font(WATERMARK_FONT_PATH, 50 * scale_factor)
+
+        self.margin = 50 * scale_factor
+        self.watermark_overlay, self.watermark_position = self._render_watermark(watermark)
+
+        # Content must end above both the footer line and the watermark
+        footer_top = self.background.height - self.margin - self.footer_font.size - offset
+        bottom_limit = min(footer_top, self.watermark_position[1]) - 10 * scale_factor
+        self.layout = CardLayout(
+            self.background.width,
+            self.background.height,
+            bottom_limit,
+            scale_factor,
+            content_size=content_size,
+        )
+
+    # Draw the watermark once on a transparent layer covering the bottom-right
+    # corner from the watermark origin, in the same place as before
+    def _render_watermark(self, watermark):
+        pre_text, accent_text, post_text = watermark
+        font = self.watermark_font
+        bbox = font.getbbox("".join(watermark))
+        width = bbox[2] - bbox[0]
+        height = bbox[3] - bbox[1]
+        x = self.background.width - self.margin - width
+        y = self.background.height - self.margin - height - self.offset
+
+        overlay = Image.new("RGBA", (self.background.width - x, self.background.height - y), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+        pre_width = font.getbbox(pre_text)[2]
+        accent_width = font.getbbox(accent_text)[2]
+        draw.text((0, 0), pre_text, font=font, fill=(0, 0, 0))
+        draw.text((pre_width, 0), accent_text, font=font, fill=self.accent_color)
+        draw.text((pre_width + accent_width, 0), post_text, font=font, fill=(0, 0, 0))
+        return overlay, (x, y)
+
+    def render(self, title, text_content, footer_text):
+        background = self.background.copy()
+        draw = ImageDraw.Draw(background)
+        margin = self.margin
+
+        bullet_points = json.loads(text_content)
+        plan = self.layout.plan(title, list(bullet_points.values()))
+        for position, text, font in plan.items:
+            draw.text(position, text, font=font, fill=(0, 0, 0))
+
+        footer_bbox = self.footer_font.getbbox(footer_text)
+        footer_height = footer_bbox[3] - footer_bbox[1]
+        draw.text(
+            (margin, background.height - margin - footer_height - self.offset),
+            footer_text,
+            font=self.footer_font,
+            fill=(0, 0, 0),
+        )
+
+        background.paste(self.watermark_overlay, self.watermark_position, self.watermark_overlay)
+        return background
+
+
+# One renderer per configuration for the whole process
+@functools.lru_cache(maxsize=8)
+def get_renderer(background_path="background.jpg", watermark=BIORXIV_WATERMARK, content_size=20, scale_factor=2, offset=20, accent_color=ACCENT_COLOR):
+    return CardRenderer(background_path, watermark, content_size, scale_factor, offset, accent_color)
+
+
+# An encoded card ready for upload
+class EncodedImage(NamedTuple):
+    data: bytes
+    format: str
+    quality: Optional[int] = None
+    subsampling: Optional[int] = None
+
+    @property
+    def extension(self):
+        return {"JPEG": "jpg", "WEBP": "webp", "PNG": "png"}[self.format]
+
+
+# Quality probes per format while searching, and what the previous card
+# settled on per (format, subsampling, budget, size): its quality, or None if
+# the format did not fit at all. Cards look alike, so the next search starts
+# there and only looks HISTORY_WINDOW qualities either side.
+MAX_PROBES = 4
+HISTORY_WINDOW = 3
+_last_quality = {}
+
+
+# fast=True is for size probes: baseline JPEG without optimize, which comes
+# out slightly larger than the final progressive, optimized encode. WebP uses
+# method 2 either way (method 4 is three times slower for ~2% smaller files),
+# so a WebP probe is already the final encode.
+def _encode(image, fmt, quality=None, subsampling=None, fast=False):
+    buffer = io.BytesIO()
+    if fmt == "JPEG" and fast:
+        image.save(buffer, format="JPEG", quality=quality, subsampling=subsampling)
+    elif fmt == "JPEG":
+        image.save(buffer, format="JPEG", quality=quality, subsampling=subsampling, progressive=True, optimize=True)
+    elif fmt == "WEBP":
+        image.save(buffer, format="WEBP", quality=quality, method=2)
+    else:
+        image.quantize(colors=256).save(buffer, format="PNG", optimize=True)
+    return EncodedImage(buffer.getvalue(), fmt, quality, subsampling)
+
+
+# Highest quality in [min_quality, max_quality] whose encoding fits max_bytes,
+# found with at most MAX_PROBES fast probes starting from the last card's
+# result. Only the pick gets the full encode.
+def _search_quality(image, fmt, max_bytes, min_quality, max_quality, subsampling=None):
+    key = (fmt, subsampling, max_bytes, image.size)
+    best = None
+    low, high = min_quality, max_quality
+    if key not in _last_quality:
+        quality = (low + high) // 2
+    elif _last_quality[key] is None:
+        quality = min_quality  # One probe tells whether it fits this time
+    else:
+        quality = min(high, max(low, _last_quality[key]))
+        low, high = max(low, quality - HISTORY_WINDOW), min(high, quality + HISTORY_WINDOW)
+    for _ in range(MAX_PROBES):
+        if low > high:
+            break
+        probe = _encode(image, fmt, quality, subsampling, fast=True)
+        if len(probe.data) <= max_bytes:
+            best, best_probe = quality, probe
+            low = quality + 1
+        else:
+            high = quality - 1
+        quality = (low + high) // 2
+    if best is None:
+        _last_quality[key] = None
+        return None
+    if fmt == "WEBP":
+        _last_quality[key] = best
+        return best_probe
+
+    # The full encode is normally smaller than its probe; step down if not
+    while best >= min_quality:
+        encoded = _encode(image, fmt, best, subsampling)
+        if len(encoded.data) <= max_bytes:
+            _last_quality[key] = best
+            return encoded
+        best -= 2
+    _last_quality[key] = None
+    return None
+
+
+# Encode a card into at most max_bytes, in memory. Candidates are tried in
+# order of text sharpness: progressive JPEG with full-resolution chroma (4:4:4),
+# then 4:2:0 JPEG, then WebP, each at the highest quality that fits (a short
+# search, see _search_quality), but never below min_quality; then 256-colour
+# PNG. If nothing fits, the smallest JPEG at min_quality is returned.
+def encode_to_budget(image, max_bytes=DEFAULT_MAX_BYTES, min_quality=60, max_quality=95):
+    image = image.convert("RGB")
+    for fmt, subsampling in (("JPEG", 0), ("JPEG", 2), ("WEBP", None)):
+        encoded = _search_quality(image, fmt, max_bytes, min_quality, max_quality, subsampling)
+        if encoded is not None:
+            return encoded
+    encoded = _encode(image, "PNG")
+    if len(encoded.data) <= max_bytes:
+        return encoded
+    print(f"Could not encode card within {max_bytes} bytes; using JPEG quality {min_quality}")
+    return _encode(image, "JPEG", min_quality, 2)
+
+
+# Deterministic output path for a paper's card, e.g. cards/10.1101_2024.05.08.593115v2.jpg
+def card_path(paper_key, directory=CARDS_DIR):
+    return os.path.join(directory, re.sub(r"[^A-Za-z0-9.-]+", "_", paper_key).strip("_") + ".jpg")
+
+
+# One card to render. output_path=None returns the JPEG bytes instead.
+class CardJob(NamedTuple):
+    key: str
+    title: str
+    text_content: str
+    footer_text: str
+    output_path: Optional[str] = None
+
+
+def render_job(renderer_args, job, max_bytes=None):
+    renderer = get_renderer(*renderer_args)
+    image = renderer.render(job.title, job.text_content, job.footer_text)
+    if max_bytes is None:
+        if job.output_path is None:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=95)
+            return buffer.getvalue()
+        os.makedirs(os.path.dirname(job.output_path) or ".", exist_ok=True)
+        image.save(job.output_path, quality=95)
+        return job.output_path
+
+    encoded = encode_to_budget(image, max_bytes)
+    if job.output_path is None:
+        return encoded
+    output_path = f"{os.path.splitext(job.output_path)[0]}.{encoded.extension}"
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "wb") as f:
+        f.write(encoded.data)
+    return output_path
+
+
+# Render many cards in a process pool. Each worker keeps its own renderer for
+# renderer_args (the get_renderer arguments). Returns {job.key: path or bytes},
+# with None for cards that failed to render. With max_bytes, cards are encoded
+# to that size; in-memory jobs then return an EncodedImage, and file jobs get
+# the extension of the chosen format.
+def render_cards(jobs, renderer_args=(), processes=None, max_bytes=None):
+    artifacts = {}
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {job.key: executor.submit(render_job, tuple(renderer_args), job, max_bytes) for job in jobs}
+        for key, future in futures.items():
+            try:
+                artifacts[key] = future.result()
+            except Exception as e:
+                print(f"Failed to render card for {key}: {e}")
+                artifacts[key] = None
+    return artifacts
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+
+# Token bucket: allows `rate` acquisitions per second with bursts up to `capacity`
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens=1):
+        # Created lazily so the lock binds to the running loop (Python 3.8)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Requests bigger than the bucket wait for a full bucket and go into debt
+            needed = min(tokens, self.capacity)
+            self._refill()
+            while self._tokens < needed:
+                await asyncio.sleep((needed - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+
+# AIMD concurrency limit: grows by `increase` per window of successes and is
+# multiplied by `decrease` when the server pushes back (timeouts, 403/429).
+# Back-offs within `cooldown` seconds of each other count as one event.
+class AdaptiveLimiter:
+    def __init__(self, max_concurrency=50, min_concurrency=1, initial=None, increase=1.0, decrease=0.5, cooldown=5.0):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(initial if initial is not None else max_concurrency)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_backoff = float("-inf")
+        self._cond = None
+
+    def _condition(self):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def acquire(self):
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, ok=True):
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            if ok:
+                self.limit = min(self.max_concurrency, self.limit + self.increase / max(self.limit, 1.0))
+            else:
+                now = time.monotonic()
+                if now - self._last_backoff >= self.cooldown:
+                    self.limit = max(self.min_concurrency, self.limit * self.decrease)
+                    self._last_backoff = now
+                    print(f"Backing off: concurrency limit now {int(self.limit)}")
+            cond.notify_all()
+
+
+# Run `worker(item)` over a queue of items. A new item starts as soon as any
+# running one finishes and the limiter allows it. The worker returns False when
+# the server pushed back, so the limiter can back off. An item whose worker
+# raises is logged and counted as done; it never stops the other items.
+async def run_work_queue(items, worker, limiter=None):
+    limiter = limiter or AdaptiveLimiter()
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    async def runner():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await limiter.acquire()
+            ok = False
+            try:
+                ok = await worker(item) is not False
+            except Exception as e:
+                print(f"Work item {item!r} failed: {e!r}")
+                ok = True  # Not push-back from the server
+            finally:
+                await limiter.release(ok)
+
+    await asyncio.gather(*(runner() for _ in range(min(limiter.max_concurrency, queue.qsize()))))
@@ -0,0 +1,94 @@
+import re
+
+from pdf_text import get_encoding, truncate_pages
+
+DEFAULT_CONTEXT_BUDGET = 8000
+
+# Canonical section names and the headings that introduce them
+SECTION_HEADINGS = {
+    "abstract": ("abstract", "summary"),
+    "introduction": ("introduction", "background"),
+    "results": ("results", "results and discussion"),
+    "discussion": ("discussion",),
+    "conclusion": ("conclusion", "conclusions", "concluding remarks"),
+    "methods": ("methods", "materials and methods", "material and methods", "methods and materials", "experimental procedures", "star methods", "online methods"),
+    "references": ("references", "bibliography", "literature cited", "references and notes"),
+    "acknowledgements": ("acknowledgements", "acknowledgments", "acknowledgement", "acknowledgment"),
+    "supplementary": ("supplementary information", "supplementary material", "supplementary materials", "supplementary figures", "supplementary tables", "supporting information"),
+    "figure legends": ("figure legends", "figure captions", "figures"),
+    "back matter": ("author contributions", "competing interests", "declaration of interests", "conflict of interest", "conflicts of interest", "funding", "data availability", "code availability", "data and code availability"),
+}
+
+# Lower ranks are filled first; sections missing here are dropped entirely
+SECTION_RANKS = {
+    "front": 0,
+    "abstract": 0,
+    "results": 1,
+    "conclusion": 1,
+    "discussion": 2,
+    "introduction": 3,
+    "methods": 4,
+}
+
+_HEADING_TO_SECTION = {heading: name for name, headings in SECTION_HEADINGS.items() for heading in headings}
+# A heading is a line of its own, optionally numbered ("2.1", "IV."): only
+# spaces and tabs may pad it, and roman numerals are upper case, so a short
+# line of body text ("xx") is never read as a number for the next line
+_HEADING_PATTERN = re.compile(
+    r"^[ \t]*(?:(?:\d+(?:\.\d+)*|(?-i:[IVX]+))\.?[ \t]+)?(" + "|".join(sorted(map(re.escape, _HEADING_TO_SECTION), key=len, reverse=True)) + r")[ \t]*[:.]?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Figure/table legends and bare page numbers inside the kept sections
+_LEGEND_PATTERN = re.compile(r"^\s*(?:(?:Supplementary\s+)?(?:Fig\.|Figure|Table)\s+S?\d+[.:|].*|\d{1,3})\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+# Split paper text into (section, body) pairs in document order. Text before
+# the first recognised heading is the "front" (title, authors, affiliations).
+def split_sections(text):
+    sections = []
+    position = 0
+    name = "front"
+    for match in _HEADING_PATTERN.finditer(text):
+        sections.append((name, text[position:match.start()]))
+        name = _HEADING_TO_SECTION[match.group(1).lower()]
+        position = match.end()
+    sections.append((name, text[position:]))
+    return [(name, body.strip()) for name, body in sections if body.strip()]
+
+
+# Reduce paper text to about token_budget tokens for summarization. Reference
+# lists, acknowledgements, supplementary material and other back matter are
+# dropped, as are figure legends. The budget is filled rank by rank (front
+# matter and abstract first, then results and conclusions, discussion,
+# introduction, methods), so methods boilerplate only gets what the earlier
+# ranks leave; the kept parts are returned in document order. Text without recognisable structure falls back
+# to head truncation. Returns (text, token_count).
+def reduce_text(text, token_budget=DEFAULT_CONTEXT_BUDGET, model="gpt-3.5-turbo"):
+    sections = split_sections(text)
+    kept = [
+        (index, name, _LEGEND_PATTERN.sub("", body).strip())
+        for index, (name, body) in enumerate(sections)
+        if name in SECTION_RANKS
+    ]
+    if len({name for _, name, _ in kept} - {"front"}) < 2:
+        return truncate_pages([text], token_budget, model)
+
+    encoding = get_encoding(model)
+    tokens = {index: encoding.encode_ordinary(f"{name.upper()}\n{body}\n\n") for index, name, body in kept}
+
+    # Sections of equal rank split what is left evenly, shortest first, so a
+    # short section passes its unused share on to the others of its rank
+    allocation = {}
+    remaining = token_budget
+    for rank in sorted({SECTION_RANKS[name] for _, name, _ in kept}):
+        tier = sorted((index for index, name, _ in kept if SECTION_RANKS[name] == rank), key=lambda index: len(tokens[index]))
+        for position, index in enumerate(tier):
+            share = remaining // (len(tier) - position)
+            allocation[index] = min(len(tokens[index]), share)
+            remaining -= allocation[index]
+
+    # A truncated section loses its trailing blank line, so the parts are
+    # re-joined to keep each heading on a line of its own
+    parts = [encoding.decode(tokens[index][: allocation[index]]).strip() for index, _, _ in kept if allocation[index]]
+    reduced = "\n\n".join(part for part in parts if part)
+    return reduced, len(encoding.encode_ordinary(reduced))
@@ -0,0 +1,152 @@
+import asyncio
+import os
+from cache import get_cache
+from pdf_text import fetch_paper_text
+from render import ACCENT_COLOR, ARXIV_WATERMARK, BIORXIV_WATERMARK, get_renderer
+
+
+# A paper feed the bots can post from. Papers are plain dicts tagged with
+# "source" (the source name); the source knows how to key, fetch and label
+# them and how its cards look. `name` is also the prompt source in
+# summarizer.PROMPT_VERSIONS.
+class PaperSource:
+    name = None
+    watermark = None
+    accent_color = ACCENT_COLOR
+    content_size = 20
+    background_path = "background.jpg"
+    twitter_env_prefix = "TWITTER_"
+
+    # Cache and card key of a paper
+    def key(self, paper):
+        raise NotImplementedError
+
+    def pdf_url(self, paper):
+        raise NotImplementedError
+
+    def footer_text(self, paper):
+        raise NotImplementedError
+
+    # Produce the run's papers in rank order, calling on_certain(paper) for
+    # each as soon as its place is settled; returns the ranking
+    async def feed(self, run_date, on_certain, **options):
+        raise NotImplementedError
+
+    # get_renderer arguments for this source's cards
+    def renderer_args(self):
+        return (self.background_path, self.watermark, self.content_size, 2, 20, self.accent_color)
+
+
+class BiorxivSource(PaperSource):
+    name = "bioarxiv"
+    watermark = BIORXIV_WATERMARK
+
+    # DOI+version when the scraper provided them, otherwise the paper URL
+    def key(self, paper):
+        if paper.get("doi") and paper.get("version"):
+            return f"{paper['doi']}v{paper['version']}"
+        return paper["url"]
+
+    def pdf_url(self, paper):
+        pdf_url = paper["url"]
+
+        # Ensure the URL ends with .full.pdf
+        if not pdf_url.endswith(".full.pdf"):
+            pdf_url += ".full.pdf"
+        return pdf_url
+
+    def footer_text(self, paper):
+        return f"Subject Area: {paper['subject_area']}"
+
+    # Yesterday's top ten by the bioRxiv ranking, or top_k (options go to
+    # get_trending_urls)
+    async def feed(self, run_date, on_certain, **options):
+        from bioarxiv import get_trending_urls
+
+        return await get_trending_urls(on_certain=on_certain, yesterday_date=run_date, **options)
+
+
+class ArxivSource(PaperSource):
+    name = "arxiv"
+    watermark = ARXIV_WATERMARK
+    content_size = 25
+    twitter_env_prefix = "ARXIV_TWITTER_"
+
+    def key(self, paper):
+        return paper["arxiv_id"]
+
+    def pdf_url(self, paper):
+        return f"https://arxiv.org/pdf/{paper['arxiv_id']}.pdf"
+
+    def footer_text(self, paper):
+        return f"Published: {paper['publish_date']}"
+
+    # The given arXiv ids, in order, with their metadata looked up in one or
+    # two batched API calls
+    async def feed(self, run_date, on_certain, ids=()):
+        from create_image import resolve_arxiv_metadata
+
+        loop = asyncio.get_event_loop()
+        metadata = await loop.run_in_executor(None, resolve_arxiv_metadata, list(ids))
+        papers = []
+        for arxiv_id in ids:
+            if arxiv_id not in metadata:
+                print(f"Could not look up arXiv paper {arxiv_id}")
+                continue
+            paper = arxiv_paper(arxiv_id, metadata[arxiv_id])
+            papers.append(paper)
+            on_certain(paper)
+        return papers
+
+
+# Paper dict for an arXiv id. arXiv registers a DOI for every paper, which
+# keeps the ledger's one-post-per-DOI rule working across sources.
+def arxiv_paper(arxiv_id, metadata):
+    return dict(
+        metadata,
+        source="arxiv",
+        arxiv_id=arxiv_id,
+        doi=f"10.48550/arXiv.{arxiv_id}",
+        url=f"https://arxiv.org/abs/{arxiv_id}",
+    )
+
+
+BIORXIV = BiorxivSource()
+ARXIV = ArxivSource()
+SOURCES = {source.name: source for source in (BIORXIV, ARXIV)}
+
+
+# Source of a paper; scraped bioRxiv papers carry no tag
+def get_source(paper):
+    return SOURCES[paper.get("source", BIORXIV.name)]
+
+
+# Full text of a paper up to token_limit tokens, reusing text extracted by an
+# earlier run. Returns None when the PDF could not be read.
+def paper_text(source, paper, token_limit=120000, model="gpt-3.5-turbo"):
+    cache = get_cache()
+    text_key = f"text:{source.key(paper)}:{token_limit}"
+    text = cache.get_text(text_key)
+    if text is None:
+        text = fetch_paper_text(source.pdf_url(paper), token_limit, model)
+        if text is None:
+            return None
+        cache.put(text_key, text)
+    return text
+
+
+# Render one card with a source's look and save it as a JPEG
+def save_card(source, title, summary, footer_text, output_path, background_path=None, scale_factor=2, offset=20):
+    renderer = get_renderer(
+        background_path or source.background_path,
+        source.watermark,
+        source.content_size,
+        scale_factor,
+        offset,
+        source.accent_color,
+    )
+    image = renderer.render(title, summary, footer_text)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    image.save(output_path, quality=95)
+    print(f"High-resolution image saved as {output_path}")
+    return output_path
@@ -0,0 +1,359 @@
+import asyncio
+import json
+import os
+import random
+import time
+
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+from cache import DEFAULT_CACHE_DIR, content_hash, get_cache
+from pdf_text import get_encoding
+from scheduler import TokenBucket
+from sections import DEFAULT_CONTEXT_BUDGET, reduce_text
+
+MODEL = "gpt-4o-mini"
+BULLET_KEYS = ("bullet_point_1", "bullet_point_2", "bullet_point_3")
+
+# Prompt versions key cached summaries; bump one when its prompt changes
+PROMPT_VERSIONS = {
+    "bioarxiv": "bioarxiv-summary-v1",
+    "arxiv": "arxiv-summary-v1",
+}
+
+PROMPT_TEMPLATE = """ 
+    You are getting the text version of an {source} paper your goal is to provide a summary of the paper by providing bullet points which summarise the paper. 
+
+    It should be exact three bullet points which summarise the paper. Return your response in JSON format where the keys are the bullet points and the values are the summaries of the bullet points as following:
+
+    {{
+    "bullet_point_1": "content",
+    "bullet_point_2": "content",
+    "bullet_point_3": "content"
+    }}
+
+    Here is the text of the paper:
+
+    {text}
+    """
+
+# Tokens the prompt wrapper and the three-bullet answer add on top of the paper
+PROMPT_OVERHEAD_TOKENS = 150
+COMPLETION_TOKENS = 400
+
+
+def build_prompt(text, source="bioarxiv"):
+    return PROMPT_TEMPLATE.format(source=source, text=text)
+
+
+def summary_cache_key(text, source="bioarxiv"):
+    return f"summary:{PROMPT_VERSIONS[source]}:{content_hash(text)}"
+
+
+# Check a model response has exactly the three bullet_point_* string values.
+# Returns the parsed dict; raises ValueError otherwise.
+def parse_summary(content):
+    try:
+        bullet_points = json.loads(content)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Summary is not valid JSON: {e}")
+    if not isinstance(bullet_points, dict) or set(bullet_points) != set(BULLET_KEYS):
+        raise ValueError(f"Summary must have exactly the keys {', '.join(BULLET_KEYS)}")
+    if not all(isinstance(bullet_points[key], str) and bullet_points[key].strip() for key in BULLET_KEYS):
+        raise ValueError("Summary bullet points must be non-empty strings")
+    return {key: bullet_points[key] for key in BULLET_KEYS}
+
+
+_openai_client = None
+
+
+# Process-wide synchronous client shared by both bots
+def get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _openai_client
+
+
+# Summarize one paper synchronously. The text is reduced to context_budget
+# tokens (key sections, not the whole paper), and summaries are cached per
+# prompt version and text hash.
+def summarize_text(text, source="bioarxiv", context_budget=DEFAULT_CONTEXT_BUDGET, client=None):
+    if context_budget:
+        text, _ = reduce_text(text, context_budget, MODEL)
+    prompt = build_prompt(text, source)
+
+    cache = get_cache()
+    summary_key = summary_cache_key(text, source)
+    summary = cache.get_text(summary_key)
+    if summary is not None:
+        return summary
+
+    completion = (client or get_openai_client()).chat.completions.create(
+        model=MODEL,
+        response_format={"type": "json_object"},
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.0,
+    )
+
+    summary = completion.choices[0].message.content
+    cache.put(summary_key, summary)
+    return summary
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+# Concurrent summarization on the async OpenAI client. Paper text is first
+# reduced to context_budget tokens (None sends it whole). Requests are admitted
+# within a requests-per-minute and tokens-per-minute budget (token cost is the
+# tiktoken count of the paper plus prompt/answer overhead). 429s, 5xx,
+# connection errors and invalid summaries are retried with jittered
+# exponential backoff, honouring Retry-After. Pass base_url (or a client) to
+# run against a stand-in endpoint.
+class AsyncSummarizer:
+    def __init__(
+        self,
+        client=None,
+        model=MODEL,
+        rpm=500,
+        tpm=200000,
+        max_concurrency=8,
+        max_retries=5,
+        base_url=None,
+        cache=None,
+        context_budget=DEFAULT_CONTEXT_BUDGET,
+    ):
+        self.client = client or AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=base_url or os.getenv("OPENAI_BASE_URL"),
+            max_retries=0,
+        )
+        self.model = model
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.context_budget = context_budget
+        self.cache = cache if cache is not None else get_cache()
+        self._requests = TokenBucket(rpm / 60, capacity=rpm)
+        self._tokens = TokenBucket(tpm / 60, capacity=tpm)
+        self._semaphore = None
+
+    # Reduce the text, look up its cached summary and count its tokens; this
+    # tokenizes the whole paper and reads SQLite, so summarize() runs it on a
+    # worker thread. Returns (text, text_tokens, cache key, cached summary).
+    def _prepare(self, text, source, text_tokens):
+        if self.context_budget:
+            text, text_tokens = reduce_text(text, self.context_budget, self.model)
+        key = summary_cache_key(text, source)
+        cached = self.cache.get_text(key)
+        if cached is None and text_tokens is None:
+            text_tokens = len(get_encoding(self.model).encode_ordinary(text))
+        return text, text_tokens, key, cached
+
+    async def summarize(self, text, source="bioarxiv", text_tokens=None):
+        loop = asyncio.get_event_loop()
+        text, text_tokens, key, cached = await loop.run_in_executor(None, self._prepare, text, source, text_tokens)
+        if cached is not None:
+            return cached
+
+        cost = text_tokens + PROMPT_OVERHEAD_TOKENS + COMPLETION_TOKENS
+        prompt = build_prompt(text, source)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        for attempt in range(self.max_retries + 1):
+            await self._requests.acquire()
+            await self._tokens.acquire(cost)
+            try:
+                async with self._semaphore:
+                    completion = await self.client.chat.completions.create(
+                        model=self.model,
+                        response_format={"type": "json_object"},
+                        messages=[{"role": "user", "content": prompt}],
+                        temperature=0.0,
+                    )
+                summary = completion.choices[0].message.content
+                parse_summary(summary)
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError, ValueError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = _retry_after(e) or min(60, 2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"Summarization failed ({e.__class__.__name__}: {e}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            await loop.run_in_executor(None, self.cache.put, key, summary)
+            return summary
+
+    # Summarize many texts concurrently; returns summaries in input order, with
+    # None for texts that still failed after all retries
+    async def summarize_many(self, texts, source="bioarxiv", text_tokens=None):
+        text_tokens = text_tokens or [None] * len(texts)
+
+        async def run(text, tokens):
+            try:
+                return await self.summarize(text, source, tokens)
+            except Exception as e:
+                print(f"Giving up on summary: {e}")
+                return None
+
+        return await asyncio.gather(*(run(t, n) for t, n in zip(texts, text_tokens)))
+
+
+# Batch API mode for backfills and large candidate sets. Each text is reduced
+# to context_budget tokens and written as one chat-completion request to a
+# JSONL file (custom_id = DOI), which is submitted as a batch; the validated
+# summaries are mapped back to their DOIs once it finishes. Cached summaries
+# are not resubmitted and new ones are cached. prepare/submit_pending/poll/
+# finish never wait, so a batch can be collected by a later run; summarize()
+# does it all in one blocking call. Pass base_url (or a client) to run
+# against a mock batch endpoint.
+class BatchSummarizer:
+    TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+    def __init__(
+        self,
+        client=None,
+        model=MODEL,
+        base_url=None,
+        cache=None,
+        poll_interval=60,
+        work_dir=None,
+        context_budget=DEFAULT_CONTEXT_BUDGET,
+    ):
+        self.client = client or OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=base_url or os.getenv("OPENAI_BASE_URL"),
+        )
+        self.model = model
+        self.context_budget = context_budget
+        self.poll_interval = poll_interval
+        self.cache = cache if cache is not None else get_cache()
+        self.work_dir = work_dir or os.path.join(DEFAULT_CACHE_DIR, "batches")
+
+    def request_line(self, doi, text, source="bioarxiv"):
+        return {
+            "custom_id": doi,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": self.model,
+                "response_format": {"type": "json_object"},
+                "messages": [{"role": "user", "content": build_prompt(text, source)}],
+                "temperature": 0.0,
+            },
+        }
+
+    def write_requests(self, texts_by_doi, path, source="bioarxiv"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for doi, text in texts_by_doi.items():
+                f.write(json.dumps(self.request_line(doi, text, source)) + "\n")
+        return path
+
+    def submit(self, path):
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        print(f"Submitted batch {batch.id} from {path}")
+        return batch.id
+
+    def wait(self, batch_id, timeout=None):
+        started = time.monotonic()
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in self.TERMINAL_STATES:
+                return batch
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise TimeoutError(f"Batch {batch_id} still {batch.status} after {timeout}s")
+            print(f"Batch {batch_id} is {batch.status}; checking again in {self.poll_interval}s")
+            time.sleep(self.poll_interval)
+
+    # Map DOI -> validated summary for a finished batch (None when the request
+    # failed or its summary did not validate)
+    def collect(self, batch):
+        results = {}
+        if batch.output_file_id:
+            content = self.client.files.content(batch.output_file_id).text
+            for line in content.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                doi = item["custom_id"]
+                response = item.get("response") or {}
+                try:
+                    if response.get("status_code") != 200:
+                        raise ValueError(f"status {response.get('status_code')}")
+                    summary = response["body"]["choices"][0]["message"]["content"]
+                    parse_summary(summary)
+                    results[doi] = summary
+                except (KeyError, IndexError, ValueError) as e:
+                    print(f"No usable summary for {doi}: {e}")
+                    results[doi] = None
+        if batch.error_file_id:
+            for line in self.client.files.content(batch.error_file_id).text.splitlines():
+                if line.strip():
+                    results.setdefault(json.loads(line)["custom_id"], None)
+        return results
+
+    # Reduce each text and split off those with a cached summary. Returns
+    # (summaries, pending): cached summaries by DOI, and DOI -> (reduced text,
+    # summary cache key) for the rest.
+    def prepare(self, texts_by_doi, source="bioarxiv"):
+        summaries = {}
+        pending = {}
+        for doi, text in texts_by_doi.items():
+            if self.context_budget:
+                text, _ = reduce_text(text, self.context_budget, self.model)
+            key = summary_cache_key(text, source)
+            cached = self.cache.get_text(key)
+            if cached is not None:
+                summaries[doi] = cached
+            else:
+                pending[doi] = (text, key)
+        return summaries, pending
+
+    # Submit the pending texts from prepare() as one batch; returns its id
+    def submit_pending(self, pending, source="bioarxiv"):
+        path = os.path.join(self.work_dir, f"{source}-{int(time.time())}.jsonl")
+        return self.submit(self.write_requests({doi: text for doi, (text, _) in pending.items()}, path, source))
+
+    # The batch once it has finished, otherwise None; never waits
+    def poll(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        return batch if batch.status in self.TERMINAL_STATES else None
+
+    # Summaries of a finished batch for the DOIs in cache_keys (DOI -> summary
+    # cache key), None where there is no usable one; new summaries are cached
+    def finish(self, batch, cache_keys):
+        if batch.status != "completed":
+            print(f"Batch {batch.id} ended as {batch.status}")
+        summaries = {}
+        for doi, summary in self.collect(batch).items():
+            if doi not in cache_keys:
+                continue
+            summaries[doi] = summary
+            if summary is not None:
+                self.cache.put(cache_keys[doi], summary)
+        for doi in cache_keys:
+            summaries.setdefault(doi, None)
+        return summaries
+
+    # Blocking variant: submit, wait for the batch and return all summaries
+    def summarize(self, texts_by_doi, source="bioarxiv", timeout=None):
+        summaries, pending = self.prepare(texts_by_doi, source)
+        if not pending:
+            return summaries
+        batch = self.wait(self.submit_pending(pending, source), timeout)
+        summaries.update(self.finish(batch, {doi: key for doi, (_, key) in pending.items()}))
+        return summaries
@@ -0,0 +1,60 @@
+# Fields read from saved bioRxiv pages: a paper detail page, a search
+# listing, an article-metrics usage table, and the Cloudflare challenge page a
+# blocked request gets instead.
+# Run with: python -m pytest test_extract.py
+
+from extract import PageRecord, extract_page
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_detail_page():
+    record = extract_page(load("biorxiv_detail.html"))
+    assert record.title == "Cortical interneurons gate sensory adaptation through a dendritic inhibition circuit"
+    assert record.abstract.startswith("Sensory cortex adapts its responses to repeated stimuli")
+    assert record.abstract.endswith("which we confirm experimentally.")
+    assert record.date == "2024-01-03"
+    assert record.subject_areas == ["Neuroscience"]
+    assert record.dois == ["10.1101/2024.01.02.573925"]
+    assert record.metrics == {"twitter": 1248}
+    assert record.pagination_urls == []
+
+
+def test_listing_page():
+    record = extract_page(load("biorxiv_listing.html"))
+    assert len(record.dois) == 75
+    assert record.dois[:2] == ["10.1101/2024.01.01.573000", "10.1101/2024.01.02.573007"]
+    assert record.posted_dates["10.1101/2024.01.01.573000"] == "2024-01-02"
+    assert record.posted_dates["10.1101/2024.01.02.573007"] == "2024-01-03"
+    assert [url.rsplit("=", 1)[1] for url in record.pagination_urls] == ["1", "2", "3", "1"]
+    assert record.pagination_urls[0].startswith("https://www.biorxiv.org/search/jcode%3Abiorxiv")
+    assert record.title == "N/A" and record.date is None
+
+
+USAGE_PAGE = """<html><body>
+<table class="highwire-stats"><thead><tr><th>Month</th><th>Abstract</th><th>Full</th><th>PDF</th></tr></thead>
+<tbody><tr><td>Jan 2024</td><td>1,204</td><td>310</td><td>455</td></tr>
+<tr><td>Feb 2024</td><td> 98 </td><td>12</td><td>40</td></tr>
+<tr><td colspan="4">Total</td></tr></tbody></table>
+</body></html>"""
+
+
+def test_article_metrics_page():
+    assert extract_page(USAGE_PAGE).metrics == {"abstract_views": 1302, "full_text_views": 322, "pdf_downloads": 495}
+
+
+def test_challenge_page_yields_nothing():
+    assert extract_page(load("biorxiv_page.html")) == PageRecord()
+
+
+def test_unparseable_pages_yield_nothing():
+    assert extract_page("<!-- only a comment -->") == PageRecord()
+    assert extract_page("   \n") == PageRecord()
+
+
+def test_xml_declaration_is_ignored():
+    page = '<?xml version="1.0" encoding="utf-8"?>\n<html><body><h1 id="page-title">A title</h1></body></html>'
+    assert extract_page(page).title == "A title"
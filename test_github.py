@@ -0,0 +1,84 @@
+# GitHubClient against a local stand-in for the GitHub API: stale entries are
+# revalidated with their ETag, and a used-up rate limit stops further lookups.
+# Run with: python -m pytest test_github.py
+
+import asyncio
+
+from aiohttp import web
+
+from cache import PaperCache
+from github import GitHubClient
+
+
+class MockGitHub:
+    def __init__(self, remaining="60"):
+        self.remaining = remaining
+        self.requests = []
+
+    async def search_users(self, request):
+        self.requests.append(("search", request.query["q"], None))
+        user_url = str(request.url.with_path("/users/alice").with_query(None))
+        return web.json_response({"items": [{"url": user_url}]}, headers={"X-RateLimit-Remaining": self.remaining})
+
+    async def user(self, request):
+        etag = request.headers.get("If-None-Match")
+        self.requests.append(("user", request.match_info["name"], etag))
+        headers = {"ETag": '"v1"', "X-RateLimit-Remaining": self.remaining}
+        if etag == '"v1"':
+            return web.Response(status=304, headers=headers)
+        return web.json_response({"twitter_username": "alice_lab"}, headers=headers)
+
+
+def run_with(api, tmp_path, lookups, **client_args):
+    app = web.Application()
+    app.router.add_get("/search/users", api.search_users)
+    app.router.add_get("/users/{name}", api.user)
+
+    async def run():
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        cache = PaperCache(str(tmp_path / "cache"))
+        try:
+            async with GitHubClient(base_url=f"http://127.0.0.1:{port}", cache=cache, **client_args) as client:
+                return [await lookup(client) for lookup in lookups]
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def handle(client):
+    return client.twitter_handles(["alice@example.org"])
+
+
+def test_stale_entry_is_revalidated_with_etag(tmp_path):
+    api = MockGitHub()
+    results = run_with(api, tmp_path, [handle, handle], ttl_days=0)
+    assert results == [["alice_lab"], ["alice_lab"]]
+    users = [request for request in api.requests if request[0] == "user"]
+    assert users == [("user", "alice", None), ("user", "alice", '"v1"')]
+
+
+def test_fresh_entry_is_not_requested_again(tmp_path):
+    api = MockGitHub()
+    results = run_with(api, tmp_path, [handle, handle])
+    assert results == [["alice_lab"], ["alice_lab"]]
+    assert len(api.requests) == 2
+
+
+def test_used_up_rate_limit_stops_lookups(tmp_path):
+    api = MockGitHub(remaining="0")
+    results = run_with(
+        api,
+        tmp_path,
+        [
+            lambda client: client.users_for_email("alice@example.org"),
+            lambda client: client.users_for_email("bob@example.org"),
+        ],
+    )
+    assert len(results[0]) == 1
+    assert results[1] == []
+    assert [request[0] for request in api.requests] == ["search"]
@@ -0,0 +1,107 @@
+# Posting claims in the run ledger: a DOI whose tweet may have gone out is
+# never posted again, while a post Twitter refused is retried by the next run.
+# Run with: python -m pytest test_ledger.py
+
+import asyncio
+
+import requests
+import tweepy
+
+from ledger import RunLedger
+from main import post_ranking
+from post import TwitterPoster
+
+PAPER = {"url": "https://doi.org/10.1101/2024.01.01.555555", "title": "A paper", "subject_area": "Bio"}
+
+
+def response(status):
+    r = requests.Response()
+    r.status_code = status
+    r.reason = "mock"
+    r._content = b"{}"
+    return r
+
+
+class MockAPI:
+    def media_upload(self, filename=None, file=None):
+        return type("Media", (), {"media_id": 1})()
+
+
+class MockClient:
+    def __init__(self, error=None):
+        self.error = error
+        self.tweets = []
+
+    def create_tweet(self, text, media_ids):
+        if self.error is not None:
+            raise self.error
+        self.tweets.append(text)
+        return type("Tweet", (), {"data": {"id": str(len(self.tweets))}})()
+
+
+def make_ledger(tmp_path):
+    ledger = RunLedger(str(tmp_path / "ledger.sqlite"))
+    stage, paper = ledger.resume(dict(PAPER), "2024-01-01")
+    ledger.advance(paper, "rendered")
+    return ledger
+
+
+# One posting pass over PAPER, the way main() runs it once the card is ready
+def post_once(ledger, client):
+    poster = TwitterPoster(api=MockAPI(), client=client, base_delay=0)
+
+    async def run():
+        loop = asyncio.get_event_loop()
+        card, media = loop.create_future(), loop.create_future()
+        card.set_result(dict(PAPER))
+        media.set_result(1)
+        await post_ranking([PAPER], {PAPER["url"]: card}, {PAPER["url"]: media}, poster, ledger)
+
+    asyncio.run(run())
+
+
+def test_post_is_recorded_and_not_repeated(tmp_path):
+    ledger = make_ledger(tmp_path)
+    client = MockClient()
+    post_once(ledger, client)
+    post_once(ledger, client)
+    assert len(client.tweets) == 1
+    assert ledger.stage(PAPER) == "posted"
+
+
+def test_crash_mid_post_is_never_reposted(tmp_path):
+    ledger = make_ledger(tmp_path)
+    # The process died after claiming the paper, before recording the tweet
+    assert ledger.begin_post(PAPER)
+    client = MockClient()
+    post_once(ledger, client)
+    assert client.tweets == []
+    assert ledger.stage(PAPER) == "posting"
+
+
+def test_dropped_connection_keeps_the_claim(tmp_path):
+    ledger = make_ledger(tmp_path)
+    post_once(ledger, MockClient(requests.ConnectionError("connection reset")))
+    client = MockClient()
+    post_once(ledger, client)
+    assert client.tweets == []
+    assert ledger.stage(PAPER) == "posting"
+
+
+def test_server_error_keeps_the_claim(tmp_path):
+    ledger = make_ledger(tmp_path)
+    post_once(ledger, MockClient(tweepy.TwitterServerError(response(503))))
+    client = MockClient()
+    post_once(ledger, client)
+    assert client.tweets == []
+    assert ledger.stage(PAPER) == "posting"
+
+
+def test_rejected_post_is_retried_next_run(tmp_path):
+    ledger = make_ledger(tmp_path)
+    post_once(ledger, MockClient(tweepy.Forbidden(response(403))))
+    assert ledger.stage(PAPER) == "rendered"
+    client = MockClient()
+    post_once(ledger, client)
+    assert len(client.tweets) == 1
+    assert ledger.stage(PAPER) == "posted"
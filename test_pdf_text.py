@@ -0,0 +1,25 @@
+import requests
+import tiktoken
+
+import pdf_text
+
+
+def offline(model):
+    raise requests.ConnectionError("no network")
+
+
+def test_offline_runner_counts_tokens_approximately(monkeypatch):
+    monkeypatch.setattr(tiktoken, "encoding_for_model", offline)
+    pdf_text.get_encoding.cache_clear()
+    try:
+        encoding = pdf_text.get_encoding("gpt-4o-mini")
+        assert isinstance(encoding, pdf_text.ApproximateEncoding)
+        pages = ["First page of the paper.\n", "Second page with more text.\n"]
+        text, tokens = pdf_text.truncate_pages(pages, 1000, "gpt-4o-mini")
+        assert text == "".join(pages)
+        assert tokens == len(encoding.encode_ordinary(text))
+        text, tokens = pdf_text.truncate_pages(pages, 5, "gpt-4o-mini")
+        assert tokens == 5
+        assert text == "First page "
+    finally:
+        pdf_text.get_encoding.cache_clear()
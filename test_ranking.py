@@ -0,0 +1,65 @@
+# TopKRanker: ties go to the first arrival, the heap stays at k records, and
+# release_certain hands out each record once, as soon as its place is sure.
+# Run with: python -m pytest test_ranking.py
+
+from ranking import TopKRanker
+
+
+def paper(name, score):
+    return {"name": name, "score": score}
+
+
+def ranker(k):
+    return TopKRanker(k, score=lambda record: record["score"])
+
+
+def names(records):
+    return [record["name"] for record in records]
+
+
+def test_ties_go_to_the_first_arrival():
+    top = ranker(2)
+    assert top.push(paper("a", 5))
+    assert top.push(paper("b", 5))
+    assert not top.push(paper("c", 5))
+    assert names(top.results()) == ["a", "b"]
+
+
+def test_lowest_record_is_evicted_at_k():
+    top = ranker(2)
+    for name, score in [("a", 1), ("b", 3), ("c", 2)]:
+        top.push(paper(name, score))
+    assert len(top) == 2
+    assert names(top.results()) == ["b", "c"]
+    assert top.threshold == 2
+    assert not top.push(paper("d", 1))
+    assert top.push(paper("e", 4))
+    assert names(top.results()) == ["e", "b"]
+
+
+def test_threshold_is_open_until_full():
+    top = ranker(3)
+    top.push(paper("a", 1))
+    assert top.threshold == float("-inf")
+
+
+def test_release_as_remaining_falls():
+    top = ranker(3)
+    stream = [paper("a", 9), paper("b", 1), paper("c", 5), paper("d", 7), paper("e", 2)]
+    released = []
+    for position, record in enumerate(stream):
+        top.push(record)
+        released.append(names(top.release_certain(len(stream) - position - 1)))
+    # With 2 records left only the leader is safe; each later record frees
+    # one more rank, and at the end the whole top k is out
+    assert released == [[], [], ["a"], ["d"], ["c"]]
+    assert names(top.results()) == ["a", "d", "c"]
+    assert top.release_certain(0) == []
+
+
+def test_release_with_score_bound():
+    top = ranker(2)
+    top.push(paper("a", 9))
+    top.push(paper("b", 4))
+    assert names(top.release_certain(10, max_remaining_score=5)) == ["a"]
+    assert top.release_certain(10, max_remaining_score=5) == []
@@ -0,0 +1,64 @@
+# Section splitting and budget allocation in sections.reduce_text, with a
+# byte-level tokenizer (one token per byte) so the test needs no BPE files.
+# Run with: python -m pytest test_sections.py
+
+import pytest
+import tiktoken
+
+import pdf_text
+import sections
+from sections import reduce_text, split_sections
+
+BYTES = tiktoken.Encoding("bytes", pat_str=r"\S+|\s+", mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={})
+
+
+@pytest.fixture(autouse=True)
+def byte_tokens(monkeypatch):
+    monkeypatch.setattr(sections, "get_encoding", lambda model: BYTES)
+    monkeypatch.setattr(pdf_text, "get_encoding", lambda model: BYTES)
+
+
+def body(word, tokens):
+    return " ".join([word] * (tokens // (len(word) + 1)))
+
+
+def test_short_line_is_not_read_as_a_heading_number():
+    assert split_sections("Title\nAbstract\nxx\nIntroduction\nBody text.") == [
+        ("front", "Title"),
+        ("abstract", "xx"),
+        ("introduction", "Body text."),
+    ]
+
+
+def test_numbered_headings():
+    text = "Abstract\nWe show.\nIV. Results\nR.\n2.1 Methods:\nM.\niv. discussion\nD."
+    assert [name for name, _ in split_sections(text)] == ["abstract", "results", "methods"]
+
+
+def test_budget_goes_to_higher_ranks_first():
+    paper = "\n".join([
+        "A title",
+        "Abstract", body("abstract", 500),
+        "Introduction", body("intro", 3000),
+        "Methods", body("method", 3000),
+        "Results", body("result", 3000),
+        "Discussion", body("discussion", 3000),
+        "References", body("ref", 3000),
+    ])
+    reduced, tokens = reduce_text(paper, 8000)
+    assert tokens == len(reduced.encode()) <= 8000
+    # Abstract, results and discussion fit whole; the introduction gets the
+    # rest and methods (ranked last) nothing
+    assert body("abstract", 500) in reduced and body("result", 3000) in reduced and body("discussion", 3000) in reduced
+    assert "INTRODUCTION" in reduced and body("intro", 3000) not in reduced
+    assert "method" not in reduced.lower() and "ref" not in reduced
+
+
+def test_equal_ranks_share_evenly():
+    paper = "\n".join(["Abstract", body("abstract", 100), "Results", body("result", 4000), "Conclusion", body("conclusion", 4000)])
+    reduced, _ = reduce_text(paper, 3000)
+    parts = {part.split("\n", 1)[0]: len(part) for part in reduced.split("\n\n")}
+    # The abstract fits whole; results and conclusion split the rest
+    assert parts["ABSTRACT"] > 90
+    assert abs(parts["RESULTS"] - parts["CONCLUSION"]) <= 2
+    assert parts["RESULTS"] + parts["CONCLUSION"] > 2850
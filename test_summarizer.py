@@ -0,0 +1,92 @@
+# AsyncSummarizer against a fake AsyncOpenAI client: rate-limited and invalid
+# answers are retried, Retry-After sets the wait, and only a valid summary is
+# cached. Run with: python -m pytest test_summarizer.py
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from cache import PaperCache
+from summarizer import AsyncSummarizer
+
+SUMMARY = json.dumps({"bullet_point_1": "One.", "bullet_point_2": "Two.", "bullet_point_3": "Three."})
+
+
+def rate_limited(retry_after=None):
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    response = SimpleNamespace(status_code=429, headers=headers, request=None)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+# Answers each request with the next scripted outcome: a string is returned as
+# the completion content, an exception is raised
+class FakeClient:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        message = SimpleNamespace(content=outcome)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return delays
+
+
+def summarize(client, tmp_path, text="Paper text.", max_retries=5):
+    cache = PaperCache(str(tmp_path / "cache"))
+    summarizer = AsyncSummarizer(client=client, cache=cache, context_budget=None, max_retries=max_retries)
+    return asyncio.run(summarizer.summarize(text, text_tokens=100))
+
+
+def test_rate_limit_is_retried_after_retry_after(tmp_path, delays):
+    client = FakeClient([rate_limited("7"), SUMMARY])
+    assert summarize(client, tmp_path) == SUMMARY
+    assert client.calls == 2
+    assert delays == [7.0]
+
+
+def test_backoff_without_retry_after(tmp_path, delays):
+    client = FakeClient([rate_limited(), rate_limited(), SUMMARY])
+    assert summarize(client, tmp_path) == SUMMARY
+    assert 0.5 <= delays[0] <= 1.5
+    assert 1.0 <= delays[1] <= 3.0
+
+
+def test_invalid_summary_is_retried(tmp_path, delays):
+    client = FakeClient([json.dumps({"bullet_point_1": "Only one."}), "not json", SUMMARY])
+    assert summarize(client, tmp_path) == SUMMARY
+    assert client.calls == 3
+    assert len(delays) == 2
+
+
+def test_summary_is_cached(tmp_path, delays):
+    client = FakeClient([SUMMARY])
+    assert summarize(client, tmp_path) == SUMMARY
+    assert summarize(client, tmp_path) == SUMMARY
+    assert client.calls == 1
+
+
+def test_invalid_summary_is_not_cached_after_last_retry(tmp_path, delays):
+    client = FakeClient(["not json", "not json"])
+    with pytest.raises(ValueError):
+        summarize(client, tmp_path, max_retries=1)
+    client = FakeClient([SUMMARY])
+    assert summarize(client, tmp_path, max_retries=1) == SUMMARY
+    assert client.calls == 1